@@ -1,9 +1,8 @@
 import streamlit as st
-import os
-from main import DDRGenerator
-from visualize import visualize_severity, generate_summary_stats
+import time
+from main import DDRGenerator, create_client
+from jobs import JobQueue
 import json
-from datetime import datetime
 
 st.set_page_config(
     page_title="DDR Report Generator",
@@ -15,16 +14,29 @@ st.title("🏠 DDR Report Generator")
 st.markdown("### AI-Powered Detailed Diagnostic Report Generation")
 st.markdown("---")
 
-# Create output directory if it doesn't exist
-os.makedirs("output", exist_ok=True)
-os.makedirs("temp_uploads", exist_ok=True)
+STAGE_LABELS = {
+    "extract": "Extracting observations...",
+    "generate": "Generating DDR report...",
+    "visualize": "Creating visualizations...",
+    "stats": "Computing statistics...",
+}
+
+@st.cache_resource
+def get_generator():
+    """One generator, and one pooled LLM client, shared by every session of this process"""
+    return DDRGenerator(client=create_client())
+
+@st.cache_resource
+def get_job_queue():
+    """Worker pool shared by every session; throughput scales with DDR_JOB_WORKERS, not open tabs"""
+    return JobQueue(get_generator()).start()
 
 # Sidebar
 with st.sidebar:
     st.header("📋 Instructions")
     st.markdown("""
-    1. Upload your **Inspection Report** (txt file)
-    2. Upload your **Thermal Report** (txt file)
+    1. Upload your **Inspection Report** (txt or pdf file)
+    2. Upload your **Thermal Report** (txt or pdf file)
     3. Click **Generate DDR Report**
     4. Download the generated report
     
@@ -53,31 +65,37 @@ with col1:
     st.subheader("📁 Upload Inspection Report")
     inspection_file = st.file_uploader(
         "Choose inspection report file",
-        type=['txt'],
+        type=['txt', 'pdf'],
         key="inspection"
     )
     
     if inspection_file:
         st.success(f"✅ Loaded: {inspection_file.name}")
-        inspection_preview = inspection_file.read().decode('utf-8')
-        with st.expander("Preview Inspection Report"):
-            st.text_area("Content", inspection_preview, height=200, key="insp_preview")
-        inspection_file.seek(0)  # Reset file pointer
+        if inspection_file.name.lower().endswith('.pdf'):
+            st.caption("PDF text is extracted page by page when the report is generated")
+        else:
+            inspection_preview = inspection_file.read().decode('utf-8')
+            with st.expander("Preview Inspection Report"):
+                st.text_area("Content", inspection_preview, height=200, key="insp_preview")
+            inspection_file.seek(0)  # Reset file pointer
 
 with col2:
     st.subheader("🌡️ Upload Thermal Report")
     thermal_file = st.file_uploader(
         "Choose thermal report file",
-        type=['txt'],
+        type=['txt', 'pdf'],
         key="thermal"
     )
     
     if thermal_file:
         st.success(f"✅ Loaded: {thermal_file.name}")
-        thermal_preview = thermal_file.read().decode('utf-8')
-        with st.expander("Preview Thermal Report"):
-            st.text_area("Content", thermal_preview, height=200, key="therm_preview")
-        thermal_file.seek(0)  # Reset file pointer
+        if thermal_file.name.lower().endswith('.pdf'):
+            st.caption("PDF text is extracted page by page when the report is generated")
+        else:
+            thermal_preview = thermal_file.read().decode('utf-8')
+            with st.expander("Preview Thermal Report"):
+                st.text_area("Content", thermal_preview, height=200, key="therm_preview")
+            thermal_file.seek(0)  # Reset file pointer
 
 st.markdown("---")
 
@@ -86,135 +104,93 @@ if st.button("🚀 Generate DDR Report", type="primary", use_container_width=Tru
     if not inspection_file or not thermal_file:
         st.error("⚠️ Please upload both inspection and thermal reports!")
     else:
-        try:
-            with st.spinner("🔄 Processing documents..."):
-                # Save uploaded files temporarily
-                inspection_path = "temp_uploads/inspection_report.txt"
-                thermal_path = "temp_uploads/thermal_report.txt"
-                
-                with open(inspection_path, 'wb') as f:
-                    f.write(inspection_file.read())
-                with open(thermal_path, 'wb') as f:
-                    f.write(thermal_file.read())
-                
-                # Initialize generator
-                generator = DDRGenerator()
-                
-                # Progress tracking
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-                
-                # Load documents
-                status_text.text("📖 Loading documents...")
-                progress_bar.progress(10)
-                inspection_text = generator.load_document(inspection_path)
-                thermal_text = generator.load_document(thermal_path)
-                
-                # Extract observations
-                status_text.text("🔍 Extracting observations from inspection report...")
-                progress_bar.progress(30)
-                inspection_data = generator.extract_observations(inspection_text, "inspection")
-                
-                status_text.text("🌡️ Extracting observations from thermal report...")
-                progress_bar.progress(50)
-                thermal_data = generator.extract_observations(thermal_text, "thermal")
-                
-                # Merge observations
-                status_text.text("🔄 Merging and deduplicating observations...")
-                progress_bar.progress(70)
-                merged = generator.merge_observations(inspection_data, thermal_data)
-                
-                # Generate DDR
-                status_text.text("📝 Generating DDR report...")
-                progress_bar.progress(85)
-                ddr_report = generator.generate_ddr(merged)
-                
-                # Save report
-                output_path = "output/generated_ddr.md"
-                generator.save_report(ddr_report, output_path)
-                
-                # Generate visualizations
-                status_text.text("📊 Creating visualizations...")
-                progress_bar.progress(95)
-                visualize_severity(merged)
-                stats = generate_summary_stats(inspection_data, thermal_data)
-                
-                # Generate metadata
-                metadata = {
-                    "generated_at": datetime.now().isoformat(),
-                    "generator_version": "1.0",
-                    "model_used": "llama-3.3-70b-versatile",
-                    "input_files": [inspection_file.name, thermal_file.name],
-                    "statistics": stats
-                }
-                
-                with open('output/metadata.json', 'w') as f:
-                    json.dump(metadata, f, indent=2)
-                
-                progress_bar.progress(100)
-                status_text.text("✅ Generation complete!")
-                
-                st.success("🎉 DDR Report generated successfully!")
-                
-                # Display results
-                st.markdown("---")
-                st.subheader("📊 Summary Statistics")
-                
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    st.metric("Inspection Observations", stats['total_inspection_observations'])
-                with col2:
-                    st.metric("Thermal Observations", stats['total_thermal_observations'])
-                with col3:
-                    st.metric("Unique Locations", stats['unique_locations'])
-                
-                # Display severity chart
-                st.subheader("📈 Severity Distribution")
-                if os.path.exists("output/severity_chart.png"):
-                    st.image("output/severity_chart.png", use_container_width=True)
-                
-                # Display report preview
-                st.subheader("📄 Generated DDR Report")
-                with st.expander("View Report", expanded=True):
-                    st.markdown(ddr_report)
-                
-                # Download buttons
-                st.markdown("---")
-                st.subheader("⬇️ Download Files")
-                
-                col1, col2, col3 = st.columns(3)
-                
-                with col1:
-                    with open(output_path, 'r') as f:
-                        st.download_button(
-                            label="📄 Download DDR Report",
-                            data=f.read(),
-                            file_name="DDR_Report.md",
-                            mime="text/markdown"
-                        )
-                
-                with col2:
-                    if os.path.exists("output/severity_chart.png"):
-                        with open("output/severity_chart.png", 'rb') as f:
-                            st.download_button(
-                                label="📊 Download Chart",
-                                data=f.read(),
-                                file_name="severity_chart.png",
-                                mime="image/png"
-                            )
-                
-                with col3:
-                    with open("output/statistics.json", 'r') as f:
-                        st.download_button(
-                            label="📈 Download Statistics",
-                            data=f.read(),
-                            file_name="statistics.json",
-                            mime="application/json"
-                        )
-                
-        except Exception as e:
-            st.error(f"❌ Error: {str(e)}")
-            st.error("Please check your API key and input files.")
+        # Hand the uploads to the worker pool; the job id in the URL survives reruns and refreshes
+        st.query_params["job"] = get_job_queue().submit(
+            inspection_file.getvalue(), thermal_file.getvalue(),
+            [inspection_file.name, thermal_file.name],
+        )
+
+# Status and results of this session's job
+job_id = st.query_params.get("job")
+job = get_job_queue().store.get(job_id) if job_id else None
+if job_id and job is None:
+    st.warning("⚠️ That report job no longer exists. Please generate it again.")
+elif job and job["status"] in ("queued", "running"):
+    if job["status"] == "queued":
+        st.info("⏳ Waiting for a free worker...")
+    else:
+        st.info(f"🔄 {STAGE_LABELS.get(job['stage'], job['stage'])}")
+    st.progress(job["progress"])
+    if job["report"]:
+        st.subheader("📄 Generated DDR Report")
+        with st.expander("View Report", expanded=True):
+            st.markdown(job["report"] + " ▌")
+    # Poll the job store until the job finishes
+    time.sleep(1)
+    st.rerun()
+elif job and job["status"] == "failed":
+    st.error(f"❌ Error: {job['error']}")
+    st.error("Please check your API key and input files.")
+elif job:
+    stats = job["stats"]
+    st.success("🎉 DDR Report generated successfully!")
+    st.subheader("📄 Generated DDR Report")
+    with st.expander("View Report", expanded=True):
+        st.markdown(job["report"])
+    
+    # Display results
+    st.markdown("---")
+    st.subheader("📊 Summary Statistics")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Inspection Observations", stats['total_inspection_observations'])
+    with col2:
+        st.metric("Thermal Observations", stats['total_thermal_observations'])
+    with col3:
+        st.metric("Unique Locations", stats['unique_locations'])
+    
+    # Display severity chart
+    st.subheader("📈 Severity Distribution")
+    st.image(job["chart_png"], use_container_width=True)
+    
+    # Download buttons
+    st.markdown("---")
+    st.subheader("⬇️ Download Files")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.download_button(
+            label="📄 Download DDR Report",
+            data=job["report"],
+            file_name="DDR_Report.md",
+            mime="text/markdown"
+        )
+    
+    with col2:
+        st.download_button(
+            label="📊 Download Chart",
+            data=job["chart_png"],
+            file_name="severity_chart.png",
+            mime="image/png"
+        )
+    
+    with col3:
+        st.download_button(
+            label="📈 Download Statistics",
+            data=json.dumps(stats, indent=2),
+            file_name="statistics.json",
+            mime="application/json"
+        )
+    
+    with col4:
+        st.download_button(
+            label="📋 Download Metadata",
+            data=json.dumps(job["metadata"], indent=2),
+            file_name="metadata.json",
+            mime="application/json"
+        )
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,112 @@
+import os
+import math
+import time
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from main import DDRGenerator, process_property
+from rate_limit import RateLimiter
+
+
+def find_properties(input_root):
+    """Find property folders that contain both an inspection and a thermal report
+
+    Returns a sorted list of (property_dir, inspection_path, thermal_path).
+    """
+    properties = []
+    for dirpath, dirnames, filenames in os.walk(input_root):
+        dirnames.sort()
+        report_files = sorted(name for name in filenames if name.lower().endswith(('.txt', '.pdf')))
+        inspection = next((name for name in report_files if 'inspection' in name.lower()), None)
+        thermal = next((name for name in report_files if 'thermal' in name.lower()), None)
+        if inspection and thermal:
+            properties.append((
+                dirpath,
+                os.path.join(dirpath, inspection),
+                os.path.join(dirpath, thermal),
+            ))
+    return sorted(properties)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def run_batch(generator, input_root, output_root, concurrency=4):
+    """Process every property under input_root with at most `concurrency` in flight"""
+    properties = find_properties(input_root)
+    print(f"Found {len(properties)} properties under {input_root}")
+
+    def run_one(property_dir, inspection_path, thermal_path):
+        relative = os.path.relpath(property_dir, input_root)
+        output_dir = os.path.join(output_root, relative)
+        started = time.perf_counter()
+        process_property(generator, inspection_path, thermal_path, output_dir)
+        return time.perf_counter() - started
+
+    results = []
+    batch_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(run_one, *prop): prop[0] for prop in properties}
+        for future in as_completed(futures):
+            property_dir = futures[future]
+            try:
+                latency = future.result()
+                results.append({"property": property_dir, "ok": True, "latency_seconds": round(latency, 3)})
+            except Exception as e:
+                results.append({"property": property_dir, "ok": False, "error": str(e)})
+                print(f"❌ {property_dir}: {e}")
+    elapsed = time.perf_counter() - batch_started
+
+    latencies = [r['latency_seconds'] for r in results if r['ok']]
+    summary = {
+        "properties": len(properties),
+        "succeeded": len(latencies),
+        "failed": len(results) - len(latencies),
+        "elapsed_seconds": round(elapsed, 3),
+        "properties_per_minute": round(len(latencies) / elapsed * 60, 2) if elapsed else 0.0,
+        "latency_p50_seconds": round(percentile(latencies, 50), 3),
+        "latency_p95_seconds": round(percentile(latencies, 95), 3),
+        "failures": [r for r in results if not r['ok']],
+        "cache": generator.cache.stats(),
+    }
+
+    os.makedirs(output_root, exist_ok=True)
+    with open(os.path.join(output_root, 'batch_summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def print_summary(summary):
+    print("\n" + "="*60)
+    print("📦 BATCH SUMMARY")
+    print("="*60)
+    print(f"Properties: {summary['properties']}  ✅ {summary['succeeded']}  ❌ {summary['failed']}")
+    print(f"Throughput: {summary['properties_per_minute']} properties/min")
+    print(f"Latency: p50 {summary['latency_p50_seconds']}s, p95 {summary['latency_p95_seconds']}s")
+    for failure in summary['failures']:
+        print(f"   ❌ {failure['property']}: {failure['error']}")
+    print("="*60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate DDR reports for a directory tree of property folders")
+    parser.add_argument("input_root", help="Folder containing one sub-folder per property")
+    parser.add_argument("--output-root", default="output/batch", help="Where per-property outputs are written")
+    parser.add_argument("--concurrency", type=int, default=4, help="Properties processed in parallel")
+    parser.add_argument("--rpm", type=int, default=30, help="LLM requests per minute limit (0 = unlimited)")
+    parser.add_argument("--tpm", type=int, default=12000, help="LLM tokens per minute limit (0 = unlimited)")
+    args = parser.parse_args()
+
+    generator = DDRGenerator(rate_limiter=RateLimiter(args.rpm or None, args.tpm or None))
+    summary = run_batch(generator, args.input_root, args.output_root, args.concurrency)
+    print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
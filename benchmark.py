@@ -0,0 +1,239 @@
+import io
+import os
+import json
+import time
+import random
+import argparse
+import datetime
+import tempfile
+from contextlib import redirect_stdout
+
+from main import DDRGenerator, create_client, process_property
+from llm_cache import LLMCache
+from stub_server import StubLLMServer
+from observation_store import ObservationStore
+from batch import run_batch, percentile
+
+ROOMS = ["Master Bedroom", "Bedroom 2", "Kitchen", "Living Room", "Bathroom",
+         "Attic Space", "Basement", "Garage", "Hallway", "Exterior (North Side)"]
+AREAS = ["North Wall", "Ceiling", "Floor", "Window frame", "South Wall"]
+FINDINGS = {
+    "inspection": ["Water stain visible on ceiling", "Paint is bubbling and peeling",
+                   "Drywall feels soft when pressed", "Window caulking is cracked",
+                   "Carpet near baseboard has dark discoloration", "Musty smell detected"],
+    "thermal": ["Cold spot detected: 58°F (14.4°C)", "Irregular cold zones detected",
+                "Thermal bridging detected at window frame", "Wet insulation shows as cold mass",
+                "Temperature drop of 8°F at frame edges"],
+}
+SEVERITIES = ["low", "medium", "high"]
+
+
+def synthetic_report(n_observations, document_type, seed=0):
+    """Report text with n bullet findings spread over location headings"""
+    rng = random.Random(seed)
+    lines = [f"SYNTHETIC {document_type.upper()} REPORT", "Property: Benchmark Property", ""]
+    per_section = 5
+    for start in range(0, n_observations, per_section):
+        lines.append(f"{rng.choice(ROOMS)} - {rng.choice(AREAS)}:")
+        for _ in range(min(per_section, n_observations - start)):
+            lines.append(f"- {rng.choice(FINDINGS[document_type])}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def synthetic_observations(n_observations, seed=0):
+    """Extracted-observation dicts as the LLM would return them"""
+    rng = random.Random(seed)
+    observations = []
+    for i in range(n_observations):
+        source = rng.choice(["inspection", "thermal"])
+        observations.append({
+            "location": f"{rng.choice(ROOMS)} - {rng.choice(AREAS)}",
+            "issue": rng.choice(FINDINGS[source]),
+            "severity": rng.choice(SEVERITIES),
+            "details": f"reading {i}",
+            "source": source,
+        })
+    return {"observations": observations}
+
+
+def _timed(fn, repeat):
+    """Run fn `repeat` times with its output silenced and return per-run seconds"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            fn()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def _summary(timings):
+    return {
+        "runs": len(timings),
+        "mean_seconds": round(sum(timings) / len(timings), 4),
+        "p50_seconds": round(percentile(timings, 50), 4),
+        "p95_seconds": round(percentile(timings, 95), 4),
+    }
+
+
+def _write_property(folder, n_observations, seed):
+    os.makedirs(folder, exist_ok=True)
+    for doc_type in ["inspection", "thermal"]:
+        with open(os.path.join(folder, f"{doc_type}_report.txt"), "w", encoding="utf-8") as f:
+            f.write(synthetic_report(n_observations, doc_type, seed))
+
+
+def bench_pipeline(generator, sizes, repeat, workdir):
+    results = {}
+    for size in sizes:
+        folder = os.path.join(workdir, f"pipeline_{size}")
+        _write_property(folder, size, seed=size)
+        timings = _timed(lambda: process_property(
+            generator, os.path.join(folder, "inspection_report.txt"),
+            os.path.join(folder, "thermal_report.txt"), os.path.join(folder, "out"), resume=False
+        ), repeat)
+        results[str(size)] = _summary(timings)
+        print(f"   pipeline n={size}: {results[str(size)]['p50_seconds']}s p50")
+    return results
+
+
+def bench_throughput(generator, properties, size, concurrency_levels, workdir):
+    results = {}
+    input_root = os.path.join(workdir, "batch_input")
+    for i in range(properties):
+        _write_property(os.path.join(input_root, f"property_{i:03d}"), size, seed=i)
+    for concurrency in concurrency_levels:
+        output_root = os.path.join(workdir, f"batch_output_{concurrency}")
+        with redirect_stdout(io.StringIO()):
+            summary = run_batch(generator, input_root, output_root, concurrency)
+        results[str(concurrency)] = {
+            key: summary[key] for key in
+            ["properties_per_minute", "latency_p50_seconds", "latency_p95_seconds", "failed"]
+        }
+        print(f"   throughput concurrency={concurrency}: {summary['properties_per_minute']} properties/min")
+    return results
+
+
+def bench_merge(generator, sizes, repeat):
+    results = {}
+    for size in sizes:
+        half = synthetic_observations(size)
+        results[str(size)] = _summary(_timed(lambda: generator.merge_observations(half), repeat))
+        print(f"   merge n={size}: {results[str(size)]['p50_seconds']}s p50")
+    return results
+
+
+def bench_chart(generator, sizes, repeat, workdir):
+    from visualize import visualize_severity, _render_cached
+    results = {}
+    for size in sizes:
+        with redirect_stdout(io.StringIO()):
+            merged = generator.merge_observations(synthetic_observations(size), dedupe=False)
+        
+        def render():
+            # Measure a cold render, not a chart cache hit
+            _render_cached.cache_clear()
+            visualize_severity(merged, workdir)
+        results[str(size)] = _summary(_timed(render, repeat))
+        print(f"   chart n={size}: {results[str(size)]['p50_seconds']}s p50")
+    return results
+
+
+def bench_portfolio(properties, per_property, repeat, workdir):
+    """Fill an observation store with synthetic runs and time the portfolio aggregates"""
+    store = ObservationStore(os.path.join(workdir, "portfolio.db"))
+    start = datetime.datetime(2024, 1, 1)
+    for i in range(properties):
+        store.append(f"property_{i:05d}", {"inspection": synthetic_observations(per_property, seed=i)},
+                     recorded_at=start + datetime.timedelta(days=i % 365))
+    results = {}
+    for name, query in [("severity_by_room", store.severity_by_room),
+                        ("recurring_issues", store.recurring_issues),
+                        ("severity_trend", store.severity_trend)]:
+        results[name] = _summary(_timed(query, repeat))
+        print(f"   {name} over {properties * per_property} observations: {results[name]['p50_seconds']}s p50")
+    return results
+
+
+def compare(current, baseline, path=()):
+    """Print p50 changes against a previous benchmark file"""
+    for key, value in current.items():
+        if isinstance(value, dict) and isinstance(baseline.get(key), dict):
+            compare(value, baseline[key], path + (key,))
+        elif key == "p50_seconds" and baseline.get(key):
+            change = (value - baseline[key]) / baseline[key] * 100
+            print(f"   {'/'.join(path)}: {baseline[key]}s -> {value}s ({change:+.1f}%)")
+
+
+def run_benchmarks(sizes, repeat=3, latency=0.05, jitter=0.01, properties=8,
+                   concurrency_levels=(1, 4, 8), throughput_size=50, portfolio_properties=1000):
+    """Run the full suite against a local stub server and return the results dict"""
+    with StubLLMServer(latency=latency, jitter=jitter) as server, \
+            tempfile.TemporaryDirectory() as workdir:
+        generator = DDRGenerator(
+            client=create_client(api_key="stub", base_url=server.url),
+            cache=LLMCache(cache_dir=os.path.join(workdir, "cache"), bypass=True),
+            observation_store=ObservationStore(os.path.join(workdir, "observations.db")),
+        )
+        print("⏱️  End-to-end pipeline")
+        pipeline = bench_pipeline(generator, sizes, repeat, workdir)
+        print("🚀 Throughput under concurrency")
+        throughput = bench_throughput(generator, properties, throughput_size, concurrency_levels, workdir)
+        print("🔄 Merge / dedup")
+        merge = bench_merge(generator, sizes, repeat)
+        print("📊 Chart rendering")
+        chart = bench_chart(generator, sizes, repeat, workdir)
+        print("🏘️  Portfolio statistics")
+        portfolio = bench_portfolio(portfolio_properties, 20, repeat, workdir)
+        requests = server.requests
+
+    return {
+        "generated_at": datetime.datetime.now().isoformat(),
+        "config": {
+            "sizes": list(sizes), "repeat": repeat, "stub_latency": latency, "stub_jitter": jitter,
+            "properties": properties, "concurrency_levels": list(concurrency_levels),
+            "throughput_size": throughput_size, "portfolio_properties": portfolio_properties,
+        },
+        "stub_requests": requests,
+        "pipeline": pipeline,
+        "throughput": throughput,
+        "merge": merge,
+        "chart": chart,
+        "portfolio": portfolio,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline DDR pipeline benchmarks against a stub LLM server")
+    parser.add_argument("--sizes", default="10,100,1000,10000", help="Observation counts to benchmark")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--properties", type=int, default=8, help="Properties in the throughput run")
+    parser.add_argument("--concurrency", default="1,4,8", help="Concurrency levels for the throughput run")
+    parser.add_argument("--portfolio", type=int, default=1000, help="Properties in the portfolio store run")
+    parser.add_argument("--output-dir", default="output/benchmarks")
+    parser.add_argument("--compare", help="Previous results JSON to compare p50 timings against")
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        [int(n) for n in args.sizes.split(",")], args.repeat, args.latency, args.jitter,
+        args.properties, [int(n) for n in args.concurrency.split(",")], portfolio_properties=args.portfolio,
+    )
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"benchmark_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✅ Benchmark results saved to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\n📈 Compared with {args.compare}:")
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import re
+
+# "Master Bedroom - North Wall:", "Attic Space:", "THERMAL FINDINGS:" ...
+HEADING_PATTERN = re.compile(r'^[A-Za-z][^:]{0,80}:$')
+# Per-image / per-reading sub-headings stay with the location they belong to
+SUBHEADING_PATTERN = re.compile(r'^(image|photo|picture|scan|reading)\b', re.IGNORECASE)
+BULLET_PREFIXES = ('-', '*', '•')
+PREAMBLE_LIMIT = 500
+
+
+def is_heading(line):
+    """True if the line starts a new location/section of the report"""
+    line = line.strip()
+    if not line or line.startswith(BULLET_PREFIXES):
+        return False
+    return bool(HEADING_PATTERN.match(line)) and not SUBHEADING_PATTERN.match(line)
+
+
+def split_sections(text):
+    """Split a report along its location headings
+
+    Returns (preamble, sections) where preamble is the text before the first
+    heading (title, property, date...) and sections is a list of
+    (heading, section_text) with section_text including the heading line.
+    """
+    preamble_lines = []
+    sections = []
+    heading, lines = None, []
+    for line in text.splitlines():
+        if is_heading(line):
+            if heading is not None:
+                sections.append((heading, '\n'.join(lines).strip()))
+            heading, lines = line.strip().rstrip(':'), [line.strip()]
+        elif heading is None:
+            preamble_lines.append(line)
+        else:
+            lines.append(line)
+    if heading is not None:
+        sections.append((heading, '\n'.join(lines).strip()))
+    # Drop headings with nothing under them (e.g. "FINDINGS:" directly followed by a location)
+    sections = [(h, body) for h, body in sections if '\n' in body]
+    return '\n'.join(preamble_lines).strip(), sections
+
+
+def _split_plain(text, max_chars):
+    """Cut text without location headings into pieces of at most max_chars, on line boundaries where possible"""
+    pieces, current, size = [], [], 0
+    for line in text.splitlines():
+        for start in range(0, max(len(line), 1), max_chars):
+            part = line[start:start + max_chars]
+            if current and size + len(part) > max_chars:
+                pieces.append('\n'.join(current).strip())
+                current, size = [], 0
+            current.append(part)
+            size += len(part) + 1
+    if current:
+        pieces.append('\n'.join(current).strip())
+    return [piece for piece in pieces if piece]
+
+
+def chunk_document(text, max_chars=4000):
+    """Split a document into chunks of at most ~max_chars along location headings
+
+    Small neighbouring sections are packed together to keep the number of
+    calls down; each chunk is prefixed with the report preamble so the model
+    still knows which property it is looking at. A preamble longer than
+    PREAMBLE_LIMIT is also extracted as chunk(s) of its own, and a document
+    without headings is cut into plain max_chars pieces. This is
+    stream_chunks over the document's lines.
+    """
+    return list(stream_chunks(text.splitlines(), max_chars))
+
+
+class _ChunkPacker:
+    """Packs sections into chunks of at most ~max_chars, prefixed with the preamble"""
+
+    def __init__(self, preamble, max_chars):
+        preamble = preamble[:PREAMBLE_LIMIT]
+        self.preamble = preamble
+        self.budget = max(max_chars - len(preamble), max_chars // 2)
+        self.pieces, self.size = [], 0
+
+    def _chunk(self):
+        chunk = '\n\n'.join(([self.preamble] if self.preamble else []) + self.pieces)
+        self.pieces, self.size = [], 0
+        return chunk
+
+    def add(self, piece):
+        """Add one section; returns the chunk it closed, if any"""
+        full = self._chunk() if self.pieces and self.size + len(piece) > self.budget else None
+        self.pieces.append(piece)
+        self.size += len(piece) + 2
+        return full
+
+    def finish(self):
+        return self._chunk() if self.pieces else None
+
+
+def stream_chunks(lines, max_chars=4000):
+    """Split a report arriving line by line into chunks, as chunk_document describes
+
+    Each chunk is yielded as soon as it is full, so extraction can start on
+    the first chunks while the rest of the document is still being read, and
+    no more than about one chunk is held in memory. Text before the first
+    heading is the preamble that prefixes every chunk (up to
+    PREAMBLE_LIMIT); a longer preamble, or a document without headings, is
+    passed through in plain max_chars pieces.
+    """
+    head, head_size, leading = [], 0, None
+    packer = None
+    heading, section, section_size = None, [], 0
+
+    def finish_section():
+        # Headings with nothing under them are dropped, as in split_sections
+        body = '\n'.join(section).strip()
+        return packer.add(body) if '\n' in body else None
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if packer is None:
+            if not is_heading(line):
+                head.append(line)
+                head_size += len(line) + 1
+                if head_size > max_chars:
+                    # Pass full pieces of a long preamble through; keep the last one open
+                    text = '\n'.join(head)
+                    leading = leading if leading is not None else text.strip()[:PREAMBLE_LIMIT]
+                    pieces = _split_plain(text, max_chars)
+                    yield from pieces[:-1]
+                    head = pieces[-1].splitlines() if pieces else []
+                    head_size = sum(len(part) + 1 for part in head)
+                continue
+            text = '\n'.join(head).strip()
+            if leading is not None or len(text) > PREAMBLE_LIMIT:
+                yield from _split_plain(text, max_chars)
+            packer = _ChunkPacker(leading if leading is not None else text, max_chars)
+        if is_heading(line):
+            full = finish_section() if heading is not None else None
+            if full:
+                yield full
+            heading = line.strip().rstrip(':')
+            section, section_size = [line.strip()], len(line)
+            continue
+        if section_size + len(line) + 1 > packer.budget and len(section) > 1:
+            # Oversized section: close this piece and repeat the heading on the next
+            full = finish_section()
+            if full:
+                yield full
+            section, section_size = [f"{heading}:"], len(heading) + 1
+        section.append(line)
+        section_size += len(line) + 1
+
+    if packer is None:
+        yield from _split_plain('\n'.join(head), max_chars)
+        return
+    for full in (finish_section(), packer.finish()):
+        if full:
+            yield full
+
+
+def reduce_observations(results):
+    """Combine per-chunk extraction results into one observations list, dropping exact repeats"""
+    seen = set()
+    observations = []
+    for result in results:
+        for obs in result.get('observations', []):
+            key = (
+                str(obs.get('location', '')).strip().lower(),
+                str(obs.get('issue', '')).strip().lower(),
+                str(obs.get('details', '')).strip().lower(),
+            )
+            if key in seen:
+                continue
+            seen.add(key)
+            observations.append(obs)
+    return {"observations": observations}
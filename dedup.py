@@ -0,0 +1,226 @@
+import re
+from collections import Counter, defaultdict
+
+# Room vocabulary used to block observations; multi-word terms come first so they win
+ROOM_TERMS = [
+    'living room', 'dining room', 'family room', 'utility room', 'laundry room',
+    'crawl space', 'bedroom', 'bathroom', 'kitchen', 'attic', 'basement', 'garage',
+    'hallway', 'laundry', 'closet', 'exterior', 'roof', 'office', 'stairwell',
+    'balcony', 'porch', 'patio', 'foyer', 'entry', 'lounge', 'study',
+]
+ROOM_PATTERN = re.compile(r'\b(' + '|'.join(re.escape(t) for t in ROOM_TERMS) + r')s?\b(\s+\d+)?', re.IGNORECASE)
+SEPARATORS = re.compile(r'\s*[-–(),:/]+\s*')
+LOCATION_FILLER = {'inspection', 'area', 'space', 'general', 'the', 'of', 'in', 'above', 'below', 'near'}
+
+# Different words the two report types use for the same underlying defect
+PHRASE_CONCEPTS = [
+    (re.compile(r'cold (spot|zone|mass|pattern|signature)s?'), ' moisture '),
+    (re.compile(r'thermal bridging|air infiltration|draft'), ' airleak '),
+]
+WORD_CONCEPTS = {
+    'water': 'moisture', 'wet': 'moisture', 'damp': 'moisture', 'moisture': 'moisture',
+    'stain': 'moisture', 'staining': 'moisture', 'leak': 'moisture', 'leaking': 'moisture',
+    'infiltration': 'moisture', 'drip': 'moisture', 'dripping': 'moisture',
+    'mold': 'mould', 'mould': 'mould', 'musty': 'mould', 'mildew': 'mould',
+    'crack': 'crack', 'cracked': 'crack', 'cracking': 'crack', 'gap': 'crack', 'separating': 'crack',
+    'peeling': 'finish', 'bubbling': 'finish', 'paint': 'finish',
+}
+COMPONENTS = {
+    'ceiling', 'wall', 'window', 'floor', 'carpet', 'roof', 'insulation', 'gutter',
+    'caulking', 'frame', 'sill', 'baseboard', 'drywall', 'brick', 'decking', 'door', 'pipe',
+}
+STOPWORDS = {
+    'a', 'an', 'the', 'and', 'or', 'of', 'on', 'in', 'at', 'to', 'from', 'with', 'near', 'is',
+    'are', 'was', 'be', 'as', 'by', 'for', 'visible', 'observed', 'detected', 'shows', 'show',
+    'appears', 'area', 'affected', 'approximately', 'inches', 'feet', 'f', 'c',
+}
+CONCEPTS = set(WORD_CONCEPTS.values()) | {'airleak'}
+SEVERITY_RANK = {'low': 1, 'medium': 2, 'high': 3}
+TOKEN_PATTERN = re.compile(r'[a-z]+')
+
+
+def normalize_location(location):
+    """Split a free-text location into (block_key, room_label, area)
+
+    "Master Bedroom (North Wall)" -> ("master bedroom", "Master Bedroom", "north wall")
+    "Bedroom ceiling"             -> ("bedroom", "Bedroom", "ceiling")
+    "Bedroom 2"                   -> ("bedroom 2", "Bedroom 2", "")
+    """
+    location = (location or 'Unknown').strip()
+    segments = [seg for seg in SEPARATORS.split(location) if seg]
+    for index, segment in enumerate(segments):
+        match = ROOM_PATTERN.search(segment)
+        if not match:
+            continue
+        # The words before the room ("Master", "Upstairs") tell rooms of one type apart
+        qualifier = [word for word in segment[:match.start()].lower().split() if word not in LOCATION_FILLER]
+        room = match.group(1).lower()
+        ordinal = (match.group(2) or '').strip()
+        label = segment[:match.end()].strip()
+        area_parts = [segment[match.end():].strip()] + segments[:index] + segments[index + 1:]
+        area = ' '.join(
+            word for part in area_parts for word in part.lower().split()
+            if word not in LOCATION_FILLER
+        )
+        key = ' '.join(qualifier + [room, ordinal]).strip()
+        return key, label, area
+
+    words = [w for w in TOKEN_PATTERN.findall(location.lower()) if w not in LOCATION_FILLER]
+    key = ' '.join(words) or 'unknown'
+    return key, location, ''
+
+
+def room_type(location):
+    """Room category of a location: "Master Bedroom 2 - North Wall" -> "bedroom" """
+    key, _, _ = normalize_location(location)
+    match = ROOM_PATTERN.search(key)
+    return match.group(1).lower() if match else key.rstrip('0123456789 ') or key
+
+
+def _stem(word):
+    for suffix in ('ing', 'ed', 's'):
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+
+def issue_features(obs, area=''):
+    """Normalized token set describing what an observation is about
+
+    Only component words ("ceiling", "window") are taken from the area, so a
+    shared "north wall" qualifier alone does not link unrelated findings.
+    """
+    area_components = ' '.join(word for word in area.split() if word in COMPONENTS)
+    text = f"{obs.get('issue', '')} {obs.get('details', '')} {area_components}".lower()
+    for pattern, concept in PHRASE_CONCEPTS:
+        text = pattern.sub(concept, text)
+    features = set()
+    for word in TOKEN_PATTERN.findall(text):
+        if word in STOPWORDS:
+            continue
+        features.add(WORD_CONCEPTS.get(word, _stem(word)))
+    return features
+
+
+class _UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def _linked(a, b, threshold):
+    """Same defect if the descriptions overlap enough, or they share both a concept and a component"""
+    shared = a & b
+    if not shared:
+        return False
+    if len(shared) / len(a | b) >= threshold:
+        return True
+    return bool(shared & CONCEPTS) and bool(shared & COMPONENTS)
+
+
+def _cluster_block(features, threshold, max_postings):
+    """Cluster one room's observations in near-linear time
+
+    Observations with identical feature sets are linked directly; the
+    remaining comparisons run only between distinct feature sets that share a
+    feature, found through an inverted index.
+    """
+    uf = _UnionFind(len(features))
+    signatures = {}
+    for i, feats in enumerate(features):
+        first = signatures.setdefault(frozenset(feats), i)
+        if first != i and feats:
+            uf.union(first, i)
+
+    distinct = list(signatures.items())
+    postings = defaultdict(list)
+    for n, (feats, _) in enumerate(distinct):
+        for feat in feats:
+            postings[feat].append(n)
+
+    for n, (feats, i) in enumerate(distinct):
+        candidates = set()
+        for feat in feats:
+            posting = postings[feat]
+            # Very common features ("moisture" in a flooded basement) do not discriminate; skip them
+            if len(posting) <= max_postings:
+                candidates.update(m for m in posting if m > n)
+        for m in candidates:
+            other, j = distinct[m]
+            if uf.find(i) != uf.find(j) and _linked(feats, other, threshold):
+                uf.union(i, j)
+
+    clusters = defaultdict(list)
+    for i in range(len(features)):
+        clusters[uf.find(i)].append(i)
+    return [clusters[root] for root in sorted(clusters)]
+
+
+def _join_unique(values):
+    seen = []
+    for value in values:
+        value = str(value).strip()
+        if value and value.lower() not in (v.lower() for v in seen):
+            seen.append(value)
+    return '; '.join(seen)
+
+
+def _merge_cluster(label, members):
+    """Collapse linked findings into one record per defect"""
+    observations = [obs for obs, _ in members]
+    severities = [obs.get('severity') for obs in observations if obs.get('severity')]
+    severity = max(severities, key=lambda s: SEVERITY_RANK.get(str(s).lower(), 0)) if severities else 'unknown'
+    return {
+        "location": label,
+        "areas": sorted({area for _, area in members if area}),
+        "issue": _join_unique(obs.get('issue', '') for obs in observations),
+        "severity": severity,
+        "details": _join_unique(obs.get('details', '') for obs in observations),
+        "sources": sorted({obs['source'] for obs in observations if obs.get('source')}),
+        "finding_count": len(observations),
+    }
+
+
+def cluster_observations(observations, threshold=0.35, max_postings=200):
+    """Group observations by room and collapse duplicate findings across sources
+
+    Returns a dict of room label -> list of merged defect records, in the
+    order rooms first appear.
+    """
+    blocks = {}
+    for obs in observations:
+        key, label, area = normalize_location(obs.get('location'))
+        block = blocks.setdefault(key, {"labels": Counter(), "members": []})
+        block["labels"][label] += 1
+        block["members"].append((obs, area))
+
+    # A bare "Bedroom ceiling" belongs to the report's only bedroom; with several it stays on its own
+    qualified = defaultdict(list)
+    for key in blocks:
+        if key not in ROOM_TERMS:
+            qualified[room_type(key)].append(key)
+    for key in [key for key in blocks if key in ROOM_TERMS and len(qualified[key]) == 1]:
+        block = blocks.pop(key)
+        blocks[qualified[key][0]]["members"].extend(block["members"])
+
+    by_location = {}
+    for block in blocks.values():
+        label = block["labels"].most_common(1)[0][0]
+        members = block["members"]
+        features = [issue_features(obs, area) for obs, area in members]
+        records = [
+            _merge_cluster(label, [members[i] for i in cluster])
+            for cluster in _cluster_block(features, threshold, max_postings)
+        ]
+        by_location.setdefault(label, []).extend(records)
+    return by_location
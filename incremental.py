@@ -0,0 +1,181 @@
+import os
+import re
+import json
+import hashlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from chunking import split_sections
+from metrics import current_metrics
+from report_sections import LOCAL_SECTIONS, NARRATIVE_SECTIONS, render_local_sections
+
+STATE_VERSION = 1
+SECTION_HEADER = re.compile(r'^# (\d+)\. .*$', re.MULTILINE)
+# Past this share of changed locations the report is rewritten rather than patched section by section
+FULL_REGENERATION_RATIO = 0.5
+
+
+def _hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def split_report_sections(report):
+    """Split a DDR report into {section_number: section_text}, headers included"""
+    matches = list(SECTION_HEADER.finditer(report))
+    sections = {}
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(report)
+        sections[match.group(1)] = report[match.start():end].rstrip() + '\n'
+    return sections
+
+
+def splice_sections(report, replacements):
+    """Replace whole numbered sections of a report, keeping everything else byte for byte"""
+    matches = list(SECTION_HEADER.finditer(report))
+    pieces = [report[:matches[0].start()] if matches else report]
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(report)
+        original = report[match.start():end]
+        number = match.group(1)
+        if number in replacements:
+            trailing = original[len(original.rstrip()):] or '\n'
+            pieces.append(replacements[number].rstrip() + ('\n\n' if trailing.count('\n') > 1 else trailing))
+        else:
+            pieces.append(original)
+    return ''.join(pieces)
+
+
+def changed_locations(previous, current):
+    """Locations whose merged records were added, removed or modified between runs"""
+    changed = [loc for loc in current if previous.get(loc) != current[loc]]
+    removed = [loc for loc in previous if loc not in current]
+    return changed, removed
+
+
+class IncrementalRun:
+    """Re-extract only changed report sections and patch only the data-derived DDR sections
+
+    State from the previous run (per-section extraction results keyed by a
+    content hash, the merged observations and a hash of the saved report) is
+    kept in a JSON file next to the outputs.
+    """
+
+    def __init__(self, generator, state_path):
+        self.generator = generator
+        self.state_path = state_path
+        self.state = self._load_state()
+        self.new_sections = {}
+        self.stats = {"reused_sections": 0, "reextracted_sections": 0, "report_mode": None}
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        return state if state.get("version") == STATE_VERSION else {}
+
+    def extract(self, documents):
+        """Extract documents, reusing stored observations for sections whose text has not changed"""
+        previous = self.state.get("sections", {})
+        jobs = []
+        results = {}
+        for doc_type, text in documents.items():
+            preamble, sections = split_sections(text)
+            units = [body for _, body in sections] or [text]
+            keys = [_hash(doc_type, preamble, body) for body in units]
+            results[doc_type] = keys
+            for key, body in zip(keys, units):
+                if key in previous:
+                    self.new_sections[key] = previous[key]
+                    self.stats["reused_sections"] += 1
+                elif key not in self.new_sections:
+                    self.new_sections[key] = None
+                    unit_text = f"{preamble}\n\n{body}" if sections and preamble else body
+                    jobs.append((key, unit_text, doc_type))
+
+        if jobs:
+            print(f"♻️  Re-extracting {len(jobs)} changed sections "
+                  f"(reusing {self.stats['reused_sections']})")
+            with ThreadPoolExecutor(max_workers=min(len(jobs), self.generator.max_parallel_chunks)) as pool:
+                futures = {
+                    key: pool.submit(contextvars.copy_context().run,
+                                     self.generator.extract_observations, unit_text, doc_type)
+                    for key, unit_text, doc_type in jobs
+                }
+                for key, future in futures.items():
+                    self.new_sections[key] = future.result().get('observations', [])
+            self.stats["reextracted_sections"] = len(jobs)
+        else:
+            print(f"♻️  All {self.stats['reused_sections']} sections unchanged, skipping extraction")
+
+        return {
+            doc_type: {"observations": [obs for key in keys for obs in self.new_sections[key]]}
+            for doc_type, keys in results.items()
+        }
+
+    def update_report(self, merged, report_path, stats=None):
+        """Bring the report at report_path up to date with merged; returns the report text
+
+        Reuses the previous report when nothing changed. When a few locations
+        changed, the sections derived from the data are re-rendered locally and
+        the narrative sections (summary, root cause, recommendations) are
+        rewritten by one synthesis call, since they describe the changed
+        locations too; larger changes fall back to a full regeneration. stats
+        are the summary statistics used by the rendered sections.
+        """
+        previous_merged = self.state.get("merged")
+        report = None
+        if previous_merged is not None and os.path.exists(report_path):
+            with open(report_path, 'r', encoding='utf-8') as f:
+                report = f.read()
+            if _hash(report) != self.state.get("report_hash"):
+                report = None  # edited or written by another run; do not patch it
+
+        if report is None:
+            mode = "full"
+        else:
+            changed, removed = changed_locations(previous_merged, merged)
+            total = max(len(set(previous_merged) | set(merged)), 1)
+            sections = split_report_sections(report)
+            if not changed and not removed:
+                mode = "unchanged"
+            elif (len(changed) + len(removed)) / total > FULL_REGENERATION_RATIO \
+                    or not all(number in sections for number in LOCAL_SECTIONS):
+                mode = "full"
+            else:
+                mode = "partial"
+                print(f"♻️  {len(changed)} changed and {len(removed)} removed locations, "
+                      f"patching the report")
+                regenerated = split_report_sections(self.generator.generate_ddr(merged, stats=stats))
+                replacements = {number: regenerated[number] for number in NARRATIVE_SECTIONS
+                                if number in regenerated}
+                replacements.update(render_local_sections(merged, stats))
+                report = splice_sections(report, replacements)
+                self.generator.save_report(report, report_path)
+
+        if mode == "full":
+            report = ''.join(self.generator.save_report_stream(
+                self.generator.generate_ddr(merged, stream=True, stats=stats), report_path
+            ))
+        print(f"♻️  Report update mode: {mode}")
+
+        self.stats["report_mode"] = mode
+        self.state_update = {"merged": merged, "report_hash": _hash(report)}
+        metrics = current_metrics()
+        if metrics:
+            metrics.annotate("incremental", dict(self.stats))
+        return report
+
+    def save(self):
+        """Persist this run's section results and report fingerprint for the next run"""
+        state = {"version": STATE_VERSION, "sections": self.new_sections}
+        state.update(getattr(self, 'state_update', {}))
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
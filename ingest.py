@@ -0,0 +1,135 @@
+import os
+import io
+import mmap
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from chunking import stream_chunks
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # PDF support is optional; text reports work without it
+    PdfReader = None
+
+PDF_MAGIC = b'%PDF-'
+# Text files above this size are memory-mapped and decoded line by line instead of read whole
+MMAP_THRESHOLD = 8 * 1024 * 1024
+PAGES_PER_TASK = 8
+
+# The PDF each worker process extracts from, opened once by _init_worker
+_worker_reader = None
+
+
+def _require_pdf_support():
+    if PdfReader is None:
+        raise ImportError("Reading PDF reports requires pypdf (pip install pypdf)")
+
+
+def is_pdf(source):
+    """True if source (a file path or the file's bytes) is a PDF, by its header rather than its name"""
+    if isinstance(source, bytes):
+        return source.startswith(PDF_MAGIC)
+    with open(source, 'rb') as f:
+        return f.read(len(PDF_MAGIC)) == PDF_MAGIC
+
+
+def pdf_workers():
+    """Worker processes for PDF text extraction, from DDR_PDF_WORKERS (default: CPU count, up to 4)"""
+    return int(os.getenv('DDR_PDF_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+
+def _open_pdf(source):
+    _require_pdf_support()
+    return PdfReader(io.BytesIO(source) if isinstance(source, bytes) else source)
+
+
+def _page_texts(reader, start, stop):
+    return [reader.pages[index].extract_text() or '' for index in range(start, stop)]
+
+
+def _init_worker(source):
+    global _worker_reader
+    _worker_reader = _open_pdf(source)
+
+
+def _extract_pages(start, stop):
+    """Worker task: text of pages [start, stop) of the worker's PDF"""
+    return _page_texts(_worker_reader, start, stop)
+
+
+def iter_pdf_pages(source, workers=None, pages_per_task=PAGES_PER_TASK):
+    """Yield the text of each page of a PDF (path or bytes), in order, as soon as it is extracted
+
+    Pages are extracted in batches across a process pool (text extraction is
+    CPU-bound, so threads would not help); each worker opens the PDF once.
+    Only about two batches per worker are in flight at a time, so memory
+    stays bounded however long the bundle is. Short documents are read in
+    this process.
+    """
+    reader = _open_pdf(source)
+    page_count = len(reader.pages)
+    workers = pdf_workers() if workers is None else workers
+    if workers <= 1 or page_count <= pages_per_task:
+        for start in range(0, page_count, pages_per_task):
+            yield from _page_texts(reader, start, min(start + pages_per_task, page_count))
+        return
+
+    batches = iter(range(0, page_count, pages_per_task))
+    # Forking a process that runs worker threads is unsafe; start clean interpreters instead
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(source,)) as pool:
+        in_flight = deque()
+
+        def submit_next():
+            start = next(batches, None)
+            if start is not None:
+                in_flight.append(pool.submit(_extract_pages, start, min(start + pages_per_task, page_count)))
+
+        for _ in range(workers * 2):
+            submit_next()
+        while in_flight:
+            pages = in_flight.popleft().result()
+            submit_next()
+            yield from pages
+
+
+def iter_text_lines(path, mmap_threshold=None):
+    """Yield the lines of a UTF-8 text file; large files are memory-mapped rather than copied"""
+    if os.path.getsize(path) <= (MMAP_THRESHOLD if mmap_threshold is None else mmap_threshold):
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from f
+        return
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for line in iter(mapped.readline, b''):
+            yield line.decode('utf-8')
+
+
+def iter_lines(source, workers=None):
+    """Yield the lines of a report (PDF or UTF-8 text, as a file path or bytes), reading it incrementally"""
+    if not is_pdf(source):
+        if isinstance(source, bytes):
+            yield from io.StringIO(source.decode('utf-8'))
+        else:
+            yield from iter_text_lines(source)
+        return
+    for page in iter_pdf_pages(source, workers):
+        yield from io.StringIO(page)
+        yield '\n'
+
+
+def iter_document_chunks(source, max_chars=4000, workers=None):
+    """Yield a report as extraction-sized chunks along its location headings, while it is still being read"""
+    return stream_chunks(iter_lines(source, workers), max_chars)
+
+
+def read_document(source, workers=None):
+    """Whole text of a report (PDF or text, as a file path or bytes)"""
+    return ''.join(iter_lines(source, workers))
+
+
+def document_text(data, workers=None):
+    """Text of a report held in memory (an upload), as text, UTF-8 bytes or PDF bytes"""
+    if isinstance(data, str):
+        return data
+    return read_document(data, workers)
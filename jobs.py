@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import contextlib
+
+STATUSES = ("queued", "running", "done", "failed")
+# Share of the job done when each stage starts, for the progress bar
+STAGE_PROGRESS = {"queued": 0, "extract": 10, "generate": 40, "visualize": 90, "stats": 95, "done": 100}
+# A running job whose worker has not sent a heartbeat for this long is presumed dead and requeued
+LEASE_SECONDS = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    progress INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL,
+    input_files TEXT NOT NULL,
+    inspection BLOB,
+    thermal BLOB,
+    report TEXT,
+    stats TEXT,
+    metadata TEXT,
+    chart_png BLOB,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_status_finished ON jobs (status, finished_at);
+"""
+
+
+class JobStore:
+    """SQLite-backed job table: inputs, status, stage progress and finished artifacts
+
+    Each call opens its own connection, so the store can be shared between
+    worker threads and Streamlit sessions.
+    """
+
+    def __init__(self, db_path=".cache/jobs.db"):
+        self.db_path = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if columns and "heartbeat_at" not in columns:
+                # Job tables created before heartbeats were recorded
+                conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+            conn.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def add(self, inspection, thermal, input_files=None):
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, stage, created_at, input_files, inspection, thermal) "
+                "VALUES (?, 'queued', 'queued', ?, ?, ?, ?)",
+                (job_id, time.time(), json.dumps(input_files or []), _to_bytes(inspection), _to_bytes(thermal)),
+            )
+        return job_id
+
+    def claim(self):
+        """Atomically move the oldest queued job to running and return it, or None"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, inspection, thermal, input_files FROM jobs WHERE status = 'queued' "
+                "ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', stage = 'extract', progress = ?, started_at = ?, "
+                "heartbeat_at = ? WHERE id = ?",
+                (STAGE_PROGRESS["extract"], now, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        return {"id": row["id"], "inspection": row["inspection"], "thermal": row["thermal"],
+                "input_files": json.loads(row["input_files"])}
+
+    def update(self, job_id, **fields):
+        if not fields:
+            return
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def heartbeat(self, job_ids):
+        """Renew the lease of running jobs that are still being worked on"""
+        if not job_ids:
+            return
+        job_ids = list(job_ids)
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' "
+                f"AND id IN ({', '.join('?' * len(job_ids))})",
+                (time.time(), *job_ids),
+            )
+
+    def requeue_expired(self, lease_seconds=LEASE_SECONDS):
+        """Put running jobs whose lease expired (their worker died) back in the queue; returns how many
+
+        Jobs still sending heartbeats, from this process or another one sharing
+        the database, are left alone.
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'queued', stage = 'queued', progress = 0, report = NULL "
+                "WHERE status = 'running' AND COALESCE(heartbeat_at, started_at, 0) < ?",
+                (time.time() - lease_seconds,),
+            ).rowcount
+
+    def purge_finished(self, max_age_days):
+        """Delete done and failed jobs that finished more than max_age_days ago; returns how many"""
+        with self._connect() as conn:
+            return conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (time.time() - max_age_days * 24 * 3600,),
+            ).rowcount
+
+    def get(self, job_id):
+        """Job status and artifacts as a dict (without the input documents), or None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, status, stage, progress, created_at, started_at, finished_at, input_files, "
+                "report, stats, metadata, chart_png, error FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        for key in ("input_files", "stats", "metadata"):
+            job[key] = json.loads(job[key]) if job[key] else None
+        return job
+
+    def counts(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update({status: count for status, count in rows})
+        return counts
+
+
+def _to_bytes(text):
+    return text.encode('utf-8') if isinstance(text, str) else text
+
+
+class JobQueue:
+    """Worker threads that run queued jobs through DDRGenerator.generate_report
+
+    Submitting returns a job id straight away; callers poll JobStore.get for
+    status, stage progress, the partial report while it streams and, once
+    done, the artifacts. Jobs live in the store, so they survive UI reruns.
+    Workers renew a lease on each running job; a job whose lease expires
+    (its process died) is picked up again. Finished jobs are deleted after
+    retention_days (DDR_JOB_RETENTION_DAYS, default 7; 0 keeps them).
+    """
+
+    def __init__(self, generator, store=None, workers=None, poll_interval=1.0, report_flush_interval=0.5,
+                 lease_seconds=LEASE_SECONDS, retention_days=None):
+        self.generator = generator
+        self.store = store or JobStore()
+        self.workers = workers or int(os.getenv('DDR_JOB_WORKERS', '2'))
+        self.poll_interval = poll_interval
+        self.report_flush_interval = report_flush_interval
+        self.lease_seconds = lease_seconds
+        self.retention_days = (float(os.getenv('DDR_JOB_RETENTION_DAYS', '7'))
+                               if retention_days is None else retention_days)
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._running = set()
+        self._running_lock = threading.Lock()
+
+    def start(self):
+        if self.retention_days > 0:
+            purged = self.store.purge_finished(self.retention_days)
+            if purged:
+                print(f"🧹 Removed {purged} jobs finished over {self.retention_days:g} days ago")
+        self._requeue_expired()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"ddr-job-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._keep_leases, name="ddr-job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        """Stop taking new jobs and wait for the running ones to finish"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def submit(self, inspection, thermal, input_files=None):
+        job_id = self.store.add(inspection, thermal, input_files)
+        self._wakeup.set()
+        return job_id
+
+    def wait(self, job_id, timeout=None):
+        """Block until a job is done or failed (for scripts and tests) and return it"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.store.get(job_id)
+            if job is None:
+                raise KeyError(f"Unknown job id: {job_id}")
+            if job["status"] in ("done", "failed"):
+                return job
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Job {job_id} still {job['status']} after {timeout}s")
+            time.sleep(0.05)
+
+    def _requeue_expired(self):
+        requeued = self.store.requeue_expired(self.lease_seconds)
+        if requeued:
+            print(f"🔁 Requeued {requeued} interrupted jobs")
+            self._wakeup.set()
+
+    def _keep_leases(self):
+        """Renew the leases of this queue's jobs and requeue jobs whose worker stopped renewing"""
+        while not self._stopping.wait(self.lease_seconds / 4):
+            with self._running_lock:
+                running = list(self._running)
+            self.store.heartbeat(running)
+            self._requeue_expired()
+
+    def _work(self):
+        while not self._stopping.is_set():
+            job = self.store.claim()
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            with self._running_lock:
+                self._running.add(job["id"])
+            try:
+                self._run(job)
+            finally:
+                with self._running_lock:
+                    self._running.discard(job["id"])
+
+    def _run(self, job):
+        job_id = job["id"]
+        streamed = {"text": "", "flushed_at": 0.0, "observations": 0}
+
+        def on_stage(stage):
+            self.store.update(job_id, stage=stage, progress=STAGE_PROGRESS.get(stage, 0))
+
+        def on_observation(obs):
+            # Extraction progress creeps towards the generate stage as observations arrive
+            streamed["observations"] += 1
+            progress = min(STAGE_PROGRESS["extract"] + streamed["observations"], STAGE_PROGRESS["generate"] - 1)
+            self.store.update(job_id, progress=progress)
+
+        def on_chunk(chunk):
+            streamed["text"] += chunk
+            # Writing the partial report on every token would hammer SQLite
+            if time.monotonic() - streamed["flushed_at"] > self.report_flush_interval:
+                self.store.update(job_id, report=streamed["text"])
+                streamed["flushed_at"] = time.monotonic()
+
+        try:
+            result = self.generator.generate_report(
+                job["inspection"], job["thermal"], job["input_files"], on_chunk=on_chunk, on_stage=on_stage,
+                on_observation=on_observation, property_id=job_id,
+            )
+        except Exception as e:
+            print(f"❌ Job {job_id} failed: {e}")
+            self.store.update(job_id, status="failed", error=str(e), finished_at=time.time())
+            return
+        self.store.update(
+            job_id, status="done", stage="done", progress=STAGE_PROGRESS["done"], finished_at=time.time(),
+            report=result["report"], stats=json.dumps(result["stats"]),
+            metadata=json.dumps(result["metadata"]), chart_png=result["chart_png"],
+            # Inputs are no longer needed once the artifacts exist
+            inspection=None, thermal=None,
+        )
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+
+class LLMCache:
+    """Content-addressed on-disk cache for LLM completions
+
+    Entries are keyed by a SHA-256 of (model, temperature, max_tokens,
+    response_format, prompt) and stored as one JSON file each. Entries older than max_age_seconds are
+    treated as misses, and the oldest entries are evicted once the cache grows
+    past max_entries or max_bytes.
+    """
+
+    def __init__(self, cache_dir=".cache/llm", max_entries=1000,
+                 max_bytes=100 * 1024 * 1024, max_age_seconds=7 * 24 * 3600,
+                 bypass=False):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(model, temperature, max_tokens, prompt, response_format=None):
+        """Hash the request parameters into a cache key"""
+        payload = json.dumps(
+            [model, temperature, max_tokens, response_format, prompt],
+            ensure_ascii=False, separators=(',', ':')
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key, validate=None):
+        """Return the cached response text, or None on a miss
+
+        When validate is given, an entry it rejects is dropped and counted as a
+        miss, so hits only count responses that were actually served.
+        """
+        if self.bypass:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            entry = None
+
+        if entry is not None and (time.time() - entry['created_at'] > self.max_age_seconds
+                                  or validate is not None and not validate(entry['response'])):
+            self._remove(path)
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        # Touch the file so eviction is least-recently-used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry['response']
+
+    def set(self, key, response):
+        """Store a response and evict old entries if the cache is over its limits"""
+        if self.bypass:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"created_at": time.time(), "response": response}, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under the size limits"""
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if now - st.st_mtime > self.max_age_seconds:
+                self._remove(path)
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+            _, size, path = entries.pop(0)
+            self._remove(path)
+            total_bytes -= size
+
+    def clear(self):
+        """Remove every cached entry"""
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.json'):
+                self._remove(os.path.join(self.cache_dir, name))
+
+    def stats(self):
+        """Hit/miss counters for reporting"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def cache_from_env():
+    """Build the default cache, honouring DDR_CACHE_DIR and DDR_CACHE_BYPASS"""
+    return LLMCache(
+        cache_dir=os.getenv('DDR_CACHE_DIR', '.cache/llm'),
+        bypass=os.getenv('DDR_CACHE_BYPASS', '').lower() in ('1', 'true', 'yes'),
+    )
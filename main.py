@@ -1,36 +1,278 @@
-from groq import Groq
+from groq import Groq, DefaultHttpxClient
+import httpx
 import os
+import asyncio
 from dotenv import load_dotenv
 import json
+import argparse
+import uuid
 import datetime
+import contextvars
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from llm_cache import cache_from_env
+from chunking import chunk_document, reduce_observations
+from rule_parser import parse_report
+from dedup import cluster_observations
+from prompt_encoding import build_observation_payload, estimate_tokens
+from resilience import ResilientCaller, RetryPolicy
+from metrics import PipelineMetrics, current_metrics, stage_timer, timed_iter
+from incremental import IncrementalRun
+from observation_store import store_from_env
+from thermal import score_observations
+from structured import JSON_MODE, ObservationStreamParser, is_complete_extraction, validate_observation
+from routing import ModelRouter
+from pipeline import ArtifactStore, Stage, StageGraph, content_hash, file_hash
+from report_sections import render_local_sections, splice_stream
+from ingest import is_pdf, iter_document_chunks, read_document
 
 load_dotenv()
 
+class DocumentLoadError(ValueError):
+    """An input report is missing, empty or unreadable"""
+
+def parse_json_response(response_text):
+    """Decode a JSON completion, ignoring markdown code fences around it"""
+    return json.loads(response_text.replace('```json', '').replace('```', '').strip())
+
+def is_json_response(response_text):
+    try:
+        parse_json_response(response_text)
+    except ValueError:
+        return False
+    return True
+
+def create_client(api_key=None, base_url=None, timeout=None, connect_timeout=10.0,
+                  max_connections=None, max_keepalive_connections=10, keepalive_expiry=60.0):
+    """Build a Groq client backed by a bounded keep-alive connection pool
+    
+    The client is safe to share between threads, so one instance can serve
+    every report (and every Streamlit session) without a new TLS handshake
+    per request. Timeout and pool size default to DDR_LLM_TIMEOUT (seconds)
+    and DDR_LLM_MAX_CONNECTIONS. The SDK's own retries are disabled because
+    DDRGenerator retries through its RetryPolicy.
+    """
+    api_key = api_key or os.getenv('GROQ_API_KEY')
+    if not api_key:
+        raise ValueError("API key not found! Check your .env file")
+    if timeout is None:
+        timeout = float(os.getenv('DDR_LLM_TIMEOUT', '120'))
+    if max_connections is None:
+        max_connections = int(os.getenv('DDR_LLM_MAX_CONNECTIONS', '20'))
+    
+    http_timeout = httpx.Timeout(timeout, connect=connect_timeout)
+    http_client = DefaultHttpxClient(
+        timeout=http_timeout,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(max_keepalive_connections, max_connections),
+            keepalive_expiry=keepalive_expiry,
+        ),
+    )
+    return Groq(api_key=api_key, base_url=base_url, timeout=http_timeout, http_client=http_client,
+                max_retries=0)
+
 class DDRGenerator:
-    def __init__(self):
-        api_key = os.getenv('GROQ_API_KEY')
-        if not api_key:
-            raise ValueError("API key not found! Check your .env file")
-        self.client = Groq(api_key=api_key)
+    def __init__(self, client=None, cache=None, rate_limiter=None, chunk_chars=4000, max_parallel_chunks=8,
+                 prompt_token_budget=6000, retry_policy=None, fast_path=True, fast_path_threshold=0.75,
+                 observation_store=None, structured_output=True, router=None):
+        """client is any object exposing the OpenAI-style chat.completions.create
+        (Groq, OpenAI, or a client pointed at stub_server.py); by default a pooled Groq
+        client is built with create_client() from GROQ_API_KEY. Extracted observations
+        are appended to observation_store (default: store_from_env()) after every run.
+        structured_output=False falls back to parsing free-form extraction output.
+        router (default: ModelRouter.from_env()) picks the model for each request."""
+        self.client = client if client is not None else create_client()
+        self.cache = cache if cache is not None else cache_from_env()
+        self.rate_limiter = rate_limiter
+        self.resilience = ResilientCaller(retry_policy or RetryPolicy.from_env())
+        self.chunk_chars = chunk_chars
+        self.max_parallel_chunks = max_parallel_chunks
+        self.prompt_token_budget = prompt_token_budget
+        self.fast_path = fast_path
+        self.fast_path_threshold = fast_path_threshold
+        self.structured_output = structured_output
+        self.observation_store = observation_store if observation_store is not None else store_from_env()
+        self.router = router or ModelRouter.from_env()
+    
+    def _complete(self, prompt, model=None, temperature=0.1, max_tokens=2000,
+                  stage="llm", response_format=None, validate=None, use_cache=True):
+        """Send a single-prompt chat completion, served from the cache when possible
+        
+        Runs under the generator's RetryPolicy and reports usage under `stage`.
+        Only responses validate accepts are cached or served from the cache;
+        use_cache=False always calls the API.
+        """
+        model = model or self.router.large_model
+        metrics = current_metrics()
+        if metrics:
+            metrics.record_model(stage, model)
+        key = self.cache.make_key(model, temperature, max_tokens, prompt, response_format)
+        cached = self.cache.get(key, validate) if use_cache else None
+        if cached is not None:
+            if metrics:
+                metrics.record_cache_hit(stage)
+            return cached
+        
+        options = {"response_format": response_format} if response_format else {}
+        
+        def send(timeout):
+            if self.rate_limiter:
+                self.rate_limiter.acquire(prompt, max_tokens)
+            return self.client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout,
+                **options
+            )
+        response = self.resilience.call(send, stage)
+        if metrics:
+            metrics.record_request(stage, getattr(response, 'usage', None))
+        response_text = response.choices[0].message.content
+        if use_cache and (validate is None or validate(response_text)):
+            self.cache.set(key, response_text)
+        return response_text
+    
+    def _stream_complete(self, prompt, model=None, temperature=0.1, max_tokens=2000,
+                         stage="llm", response_format=None, validate=None, use_cache=True):
+        """Streaming variant of _complete: yields text chunks as they arrive
+        
+        Shares the cache with _complete; a hit is yielded as a single chunk and
+        a streamed response is only cached once it has been fully received
+        (and accepted by validate, when given).
+        """
+        model = model or self.router.large_model
+        metrics = current_metrics()
+        if metrics:
+            metrics.record_model(stage, model)
+        key = self.cache.make_key(model, temperature, max_tokens, prompt, response_format)
+        cached = self.cache.get(key, validate) if use_cache else None
+        if cached is not None:
+            if metrics:
+                metrics.record_cache_hit(stage)
+            yield cached
+            return
+        
+        options = {"response_format": response_format} if response_format else {}
+        
+        def open_stream(timeout):
+            if self.rate_limiter:
+                self.rate_limiter.acquire(prompt, max_tokens)
+            return self.client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                timeout=timeout,
+                **options
+            )
+        # Opening the stream is retried; once text has been handed to the caller it cannot be
+        # replayed, and hedging a stream would mean reading two, so neither applies mid-stream
+        stream = self.resilience.call(open_stream, stage, hedge=False)
+        parts = []
+        usage = None
+        for chunk in stream:
+            # Groq reports usage on the final chunk under x_groq; OpenAI-style servers use chunk.usage
+            usage = getattr(chunk, 'usage', None) or getattr(getattr(chunk, 'x_groq', None), 'usage', None) or usage
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if text:
+                parts.append(text)
+                yield text
+        if metrics:
+            metrics.record_request(stage, usage)
+        response_text = ''.join(parts)
+        if use_cache and (validate is None or validate(response_text)):
+            self.cache.set(key, response_text)
     
     def load_document(self, filepath):
-        """Load text from a file"""
+        """Load text from a file (UTF-8 text or PDF)"""
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return f.read()
+            return read_document(filepath)
         except FileNotFoundError:
             print(f"Error: File not found - {filepath}")
             return None
     
-    def extract_observations(self, document_text, document_type):
-        """Extract structured observations from document"""
+    def extract_observations(self, document_text, document_type, on_observation=None):
+        """Extract structured observations from document
+        
+        Templated sections (location headings with bullet findings) are parsed
+        locally by the rule-based fast path; only sections it cannot parse
+        confidently are sent to the LLM. Long documents are split along their
+        location headings, the chunks are extracted in parallel and the results
+        reduced into one observations list.
+        
+        on_observation, if given, is called with each observation as soon as it
+        is available (LLM output is then streamed and parsed incrementally). It
+        may be called from worker threads.
+        """
         print(f"Extracting data from {document_type}...")
         
-        response = self.client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{
-                "role": "user",
-                "content": f"""Extract all observations from this {document_type} report.
+        with stage_timer(f"extract.{document_type}"):
+            return self._extract_text(document_text, document_type, on_observation)
+    
+    def _extract_text(self, document_text, document_type, on_observation=None):
+        """extract_observations without its timer, for callers that time the whole document"""
+        parsed, document_text = self._fast_path(document_text, document_type, on_observation)
+        if not document_text.strip():
+            return {"observations": parsed}
+        
+        result = self._extract_with_llm(document_text, document_type, on_observation)
+        if parsed:
+            result = reduce_observations([{"observations": parsed}, result])
+        return result
+    
+    def _fast_path(self, document_text, document_type, on_observation=None):
+        """Parse what the rule-based fast path can; returns (observations, text left for the LLM)"""
+        if not self.fast_path:
+            return [], document_text
+        parsed, document_text = parse_report(document_text, document_type, self.fast_path_threshold)
+        if parsed:
+            print(f"   Fast path parsed {len(parsed)} {document_type} observations locally")
+            for obs in parsed:
+                if on_observation:
+                    on_observation(obs)
+        return parsed, document_text
+    
+    def _extract_with_llm(self, document_text, document_type, on_observation=None, model=None):
+        """LLM extraction, chunked and parallel for long documents
+        
+        The model is picked once from the size of everything sent to the LLM
+        (unless given, see extract_document), so every chunk of a long document
+        goes to the same tier.
+        """
+        model = model or self.router.extraction_model(document_text)
+        if len(document_text) <= self.chunk_chars:
+            return self._extract_chunk(document_text, document_type, on_observation, model)
+        
+        chunks = chunk_document(document_text, self.chunk_chars)
+        print(f"   Split {document_type} report into {len(chunks)} chunks")
+        with ThreadPoolExecutor(max_workers=min(len(chunks), self.max_parallel_chunks)) as pool:
+            # Each task gets a copy of the caller's context so LLM calls report into its metrics
+            futures = [
+                pool.submit(contextvars.copy_context().run, self._extract_chunk, chunk, document_type,
+                            on_observation, model)
+                for chunk in chunks
+            ]
+            results = [future.result() for future in futures]
+        return reduce_observations(results)
+    
+    def _extraction_prompt(self, document_text, document_type, already_extracted=None):
+        if already_extracted:
+            listed = '\n'.join(f"- {obs['location']}: {obs['issue']}" for obs in already_extracted)
+            task = (f"Some observations from this {document_type} report were already extracted:\n{listed}\n\n"
+                    f"Extract ONLY the remaining observations that are not in that list.")
+        elif already_extracted is not None:
+            # A follow-up after a response with no usable observations
+            task = (f"A previous extraction of this {document_type} report returned incomplete or invalid JSON. "
+                    f"Extract all observations again as one complete JSON object.")
+        else:
+            task = f"Extract all observations from this {document_type} report."
+        return f"""{task}
 
 Return ONLY a JSON object with this structure:
 {{
@@ -49,22 +291,225 @@ Document:
 {document_text}
 
 Remember: Extract ONLY what's explicitly stated. Do not invent information."""
-            }],
-            temperature=0.1,
-            max_tokens=2000
-        )
+    
+    def _extract_chunk(self, document_text, document_type, on_observation=None, model=None):
+        """Extract observations from a document (or chunk) with a single LLM call
         
-        response_text = response.choices[0].message.content
-        response_text = response_text.replace('```json', '').replace('```', '').strip()
-        return json.loads(response_text)
+        In structured mode the provider's JSON mode is requested, the output is
+        parsed incrementally and each observation is validated as its object
+        closes. If the response was cut off or some objects were invalid, one
+        follow-up request asks for only the observations still missing; when
+        the first request went to the fast model, the follow-up escalates to
+        the large one.
+        """
+        model = model or self.router.extraction_model(document_text)
+        prompt = self._extraction_prompt(document_text, document_type)
+        if not self.structured_output:
+            response_text = self._complete(prompt, model=model, temperature=0.1, max_tokens=2000, stage="extract",
+                                           validate=is_json_response)
+            try:
+                return parse_json_response(response_text)
+            except ValueError:
+                escalated = self.router.escalation_model(model)
+                if escalated is None:
+                    raise
+                self._record_escalation(document_type, model, escalated)
+                response_text = self._complete(prompt, model=escalated, temperature=0.1, max_tokens=2000,
+                                               stage="extract", validate=is_json_response, use_cache=False)
+                return parse_json_response(response_text)
+        
+        observations, complete = self._structured_extract(prompt, document_type, on_observation, model)
+        if not complete:
+            metrics = current_metrics()
+            if metrics:
+                metrics.record_remainder_request("extract")
+            print(f"   Incomplete {document_type} extraction ({len(observations)} valid observations), "
+                  f"requesting the remainder")
+            escalated = self.router.escalation_model(model)
+            if escalated is not None:
+                self._record_escalation(document_type, model, escalated)
+                model = escalated
+            remainder_prompt = self._extraction_prompt(document_text, document_type, observations)
+            remainder, remainder_complete = self._structured_extract(remainder_prompt, document_type, on_observation,
+                                                                     model, use_cache=False)
+            if not observations and not remainder and not remainder_complete:
+                raise ValueError(f"Could not extract observations from the {document_type} report")
+            observations = reduce_observations([{"observations": observations},
+                                                {"observations": remainder}])["observations"]
+        return {"observations": observations}
+    
+    def _record_escalation(self, document_type, model, escalated):
+        print(f"   Escalating {document_type} extraction from {model} to {escalated}")
+        metrics = current_metrics()
+        if metrics:
+            metrics.record_escalation("extract")
+    
+    def _structured_extract(self, prompt, document_type, on_observation=None, model=None, use_cache=True):
+        """Run one JSON-mode extraction request; returns (valid observations, complete)
+        
+        complete is False when the observations array was never closed
+        (truncated or not JSON) or an object failed validation. Only complete
+        responses are cached.
+        """
+        def validate(response_text):
+            return is_complete_extraction(response_text, document_type)
+        options = dict(model=model, temperature=0.1, max_tokens=2000, stage="extract", response_format=JSON_MODE,
+                       validate=validate, use_cache=use_cache)
+        if on_observation:
+            chunks = self._stream_complete(prompt, **options)
+        else:
+            chunks = [self._complete(prompt, **options)]
+        parser = ObservationStreamParser()
+        observations = []
+        invalid = 0
+        for chunk in chunks:
+            for obj in parser.feed(chunk):
+                obs = validate_observation(obj, document_type)
+                if obs is None:
+                    invalid += 1
+                    continue
+                observations.append(obs)
+                if on_observation:
+                    on_observation(obs)
+        invalid += parser.errors
+        if not parser.closed:
+            invalid += 1
+        if invalid:
+            metrics = current_metrics()
+            if metrics:
+                metrics.record_invalid_output("extract", invalid)
+        return observations, invalid == 0
+    
+    def extract_document(self, source, document_type, on_observation=None):
+        """Extract observations from a report file (path or bytes) while it is still being read
+        
+        Chunks go through the fast path as they stream in; the leftovers are
+        extracted by the LLM in parallel, routed on their combined size.
+        """
+        name = os.path.basename(source) if isinstance(source, str) else "upload"
+        print(f"Extracting data from {document_type} ({name}), streaming...")
+        results, pending, in_flight = [], [], deque()
+        model, llm_chars = None, 0
+        with stage_timer(f"extract.{document_type}"), \
+                ThreadPoolExecutor(max_workers=self.max_parallel_chunks) as pool:
+            def submit_pending():
+                while pending:
+                    if len(in_flight) >= self.max_parallel_chunks:
+                        in_flight.popleft().result()
+                    # Each task gets a copy of the caller's context so LLM calls report into its metrics
+                    index, text = pending.pop(0)
+                    results[index] = pool.submit(contextvars.copy_context().run, self._extract_with_llm,
+                                                 text, document_type, on_observation, model)
+                    in_flight.append(results[index])
+            
+            for chunk in iter_document_chunks(source, self.chunk_chars):
+                parsed, leftover = self._fast_path(chunk, document_type, on_observation)
+                if parsed:
+                    results.append({"observations": parsed})
+                if not leftover.strip():
+                    continue
+                pending.append((len(results), leftover))
+                results.append(None)  # Filled with the LLM extraction's future once the model is routed
+                llm_chars += len(leftover)
+                # More text cannot route a document off the large model, so that choice is final
+                routed = self.router.extraction_model_for_size(llm_chars)
+                if routed == self.router.large_model:
+                    model = routed
+                if model is not None:
+                    submit_pending()
+            if model is None:
+                model = self.router.extraction_model_for_size(llm_chars)
+            submit_pending()
+            # Results stay in document order, parsed and LLM-extracted chunks alike
+            results = [result.result() if isinstance(result, Future) else result for result in results]
+        return reduce_observations(results)
+    
+    async def aextract_observations(self, document, document_type, on_observation=None):
+        """Async variant of extract_observations (runs the blocking call in a worker thread)
+        
+        document may also be an upload's bytes; a PDF is then streamed through
+        extract_document page by page instead of being read whole first.
+        """
+        if isinstance(document, bytes):
+            if is_pdf(document):
+                return await asyncio.to_thread(self.extract_document, document, document_type, on_observation)
+            document = document.decode('utf-8')
+        return await asyncio.to_thread(self.extract_observations, document, document_type, on_observation)
+    
+    async def aextract_all(self, documents, on_observation=None):
+        """Extract observations from several documents concurrently
+        
+        documents maps document_type -> document text (or upload bytes, see
+        aextract_observations); the result maps document_type -> extracted
+        data, in the same order.
+        """
+        with stage_timer("extract"):
+            results = await asyncio.gather(*(
+                self.aextract_observations(text, doc_type, on_observation)
+                for doc_type, text in documents.items()
+            ))
+        return dict(zip(documents.keys(), results))
+    
+    async def arun_pipeline(self, documents, stream=False, on_observation=None):
+        """Extract all documents concurrently, then merge and generate the DDR
+        
+        Returns (extracted, merged, ddr_report) where extracted maps
+        document_type -> extracted data. With stream=True, ddr_report is an
+        iterator of report chunks that the caller consumes as they arrive.
+        on_observation is passed on to extract_observations.
+        """
+        from visualize import summary_stats
+        
+        extracted = await self.aextract_all(documents, on_observation)
+        self.score_readings(extracted)
+        merged = self.merge_observations(*extracted.values())
+        stats = summary_stats(extracted.get("inspection", {}), extracted.get("thermal", {}))
+        if stream:
+            return extracted, merged, self.generate_ddr(merged, stream=True, stats=stats)
+        ddr_report = await asyncio.to_thread(self.generate_ddr, merged, stats=stats)
+        return extracted, merged, ddr_report
+    
+    def score_readings(self, extracted):
+        """Set thermal observations' severity from their temperature readings, before merging
+        
+        extracted maps document_type -> extracted data; the "thermal"
+        observations are scored together as one batch and updated in place.
+        Returns how many were scored.
+        """
+        observations = extracted.get("thermal", {}).get('observations', [])
+        with stage_timer("thermal"):
+            scored = score_observations(observations)
+        if scored:
+            reclassified = sum(1 for obs in observations if 'reported_severity' in obs)
+            print(f"   Scored {scored} thermal readings ({reclassified} severities corrected)")
+            metrics = current_metrics()
+            if metrics:
+                metrics.annotate("thermal", {"scored": scored, "reclassified": reclassified})
+        return scored
     
-    def merge_observations(self, inspection_data, thermal_data):
-        """Merge observations from both reports"""
+    def merge_observations(self, *sources, dedupe=True):
+        """Merge observations from any number of extracted reports
+        
+        With dedupe=True (the default) locations are normalized to rooms and
+        findings describing the same defect across sources are collapsed into
+        one record, so the synthesis prompt sees one entry per real defect.
+        With dedupe=False observations are only grouped by exact location.
+        """
         print("Merging observations...")
         
+        with stage_timer("merge"):
+            return self._merge(sources, dedupe)
+    
+    def _merge(self, sources, dedupe):
         all_observations = []
-        all_observations.extend(inspection_data.get('observations', []))
-        all_observations.extend(thermal_data.get('observations', []))
+        for data in sources:
+            all_observations.extend(data.get('observations', []))
+        
+        if dedupe:
+            merged = cluster_observations(all_observations)
+            print(f"   {len(all_observations)} observations -> "
+                  f"{sum(len(records) for records in merged.values())} distinct defects")
+            return merged
         
         # Group by location
         by_location = {}
@@ -76,73 +521,168 @@ Remember: Extract ONLY what's explicitly stated. Do not invent information."""
         
         return by_location
     
-    def generate_ddr(self, merged_observations):
-        """Generate the final DDR report"""
+    def generate_ddr(self, merged_observations, stream=False, stats=None):
+        """Generate the final DDR report
+        
+        Only the narrative sections (summary, root cause, recommendations)
+        are written by the LLM. Area-wise observations, severity counts,
+        notes and missing information are rendered locally from the merged
+        data (and stats, the summary statistics, when given) and spliced in
+        at their place. With stream=True, returns an iterator that yields the
+        report text in chunks as the model produces them.
+        """
         print("Generating DDR report...")
         
-        observations_text = json.dumps(merged_observations, indent=2)
+        prompt, prompt_stats = self._ddr_prompt(merged_observations)
+        prompt_stats["prompt_tokens_estimate"] = estimate_tokens(prompt)
+        print(f"   Prompt size: ~{prompt_stats['prompt_tokens_estimate']} tokens "
+              f"(observations ~{prompt_stats['observation_tokens_estimate']}, "
+              f"~{prompt_stats['json_tokens_estimate']} as indented JSON)")
+        metrics = current_metrics()
+        if metrics:
+            metrics.annotate("prompt", prompt_stats)
+        local_sections = render_local_sections(merged_observations, stats, prompt_stats["omitted_note"])
+        if stream:
+            return timed_iter("generate", splice_stream(
+                self._stream_complete(prompt, model=self.router.synthesis_model, temperature=0.1,
+                                      max_tokens=1500, stage="generate"),
+                local_sections,
+            ))
+        with stage_timer("generate"):
+            response_text = self._complete(prompt, model=self.router.synthesis_model, temperature=0.1,
+                                           max_tokens=1500, stage="generate")
+            return ''.join(splice_stream([response_text], local_sections))
+
+    def _ddr_prompt(self, merged_observations):
+        """Build the DDR synthesis prompt around the compact, budgeted observation table
+        
+        Returns (prompt, prompt_stats). The stats are returned rather than kept
+        on the generator, which is shared between concurrent runs.
+        """
+        observations_text, stats = build_observation_payload(merged_observations, self.prompt_token_budget)
+        prompt_stats = {
+            "format": stats["format"],
+            "observation_tokens_estimate": stats["prompt_tokens_estimate"],
+            "json_tokens_estimate": stats["json_tokens_estimate"],
+            "token_budget": stats["token_budget"],
+            "omitted_note": stats["omitted_note"],
+        }
         
-        response = self.client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{
-                "role": "user",
-                "content": f"""You are generating a professional DDR (Detailed Diagnostic Report) for a client.
+        return f"""You are generating a professional DDR (Detailed Diagnostic Report) for a client.
 
-Here is the merged observation data from inspection and thermal reports:
+Here is the merged observation data from inspection and thermal reports, one table
+per location ("## <location>") with pipe-separated columns given in the first line:
 
 {observations_text}
 
-Generate a comprehensive DDR report with EXACTLY these sections:
+The area-wise observations, severity table and missing-information sections are produced
+separately. Write ONLY these three sections of the DDR, with EXACTLY these headers:
 
 # 1. Property Issue Summary
 [Brief overview of the main issues found]
 
-# 2. Area-wise Observations
-[Break down by location/area with specific findings from BOTH reports combined]
-
 # 3. Probable Root Cause
 [Analysis of what's likely causing the issues]
 
-# 4. Severity Assessment
-[Rate severity (Low/Medium/High) with clear reasoning]
-
 # 5. Recommended Actions
 [Specific, actionable next steps]
 
-# 6. Additional Notes
-[Any other relevant information]
-
-# 7. Missing or Unclear Information
-[List what information was not available or conflicts between sources]
-
 CRITICAL RULES:
 - DEDUPLICATE: If inspection and thermal reports describe the same issue (e.g., water stain + cold spot = same problem), combine them into ONE observation
 - CONFLICTS: If data conflicts between sources, mention both: "Inspection reports X, while thermal imaging shows Y"
-- MISSING DATA: Explicitly write "Not Available" for any standard information that's missing
 - Use ONLY information from the provided data
 - Use clear, client-friendly language (no unnecessary jargon)
 - Be specific and actionable
-- DO NOT invent facts or make assumptions beyond the data"""
-            }],
-            temperature=0.1,
-            max_tokens=4000
-        )
+- DO NOT invent facts or make assumptions beyond the data""", prompt_stats
+    
+    def generate_report(self, inspection, thermal, input_files=None, on_chunk=None, on_stage=None,
+                        property_id=None, on_observation=None):
+        """Run the whole pipeline in memory, without touching disk, and return every artifact
+        
+        inspection and thermal are text, UTF-8 bytes or PDF bytes. on_chunk
+        receives the report as it streams, on_stage each stage name and
+        on_observation each extracted observation. Observations are recorded
+        under property_id (a fresh id by default). Returns a dict with report,
+        extracted, merged, stats, chart_png, metadata and metrics.
+        """
+        # Text is decoded up front (a bad upload fails before any stage starts); PDFs stay bytes and stream
+        documents = {
+            doc_type: data.decode('utf-8') if isinstance(data, bytes) and not is_pdf(data) else data
+            for doc_type, data in (("inspection", inspection), ("thermal", thermal))
+        }
+        from visualize import visualize_severity, generate_summary_stats
+        
+        on_stage = on_stage or (lambda stage: None)
+        
+        metrics = PipelineMetrics()
+        with metrics.activate():
+            on_stage("extract")
+            extracted, merged, ddr_chunks = asyncio.run(
+                self.arun_pipeline(documents, stream=True, on_observation=on_observation)
+            )
+            on_stage("generate")
+            parts = []
+            for chunk in ddr_chunks:
+                parts.append(chunk)
+                if on_chunk:
+                    on_chunk(chunk)
+            on_stage("visualize")
+            with metrics.stage("visualize"):
+                chart_png = visualize_severity(merged, output_dir=None)
+            on_stage("stats")
+            with metrics.stage("stats"):
+                stats = generate_summary_stats(extracted["inspection"], extracted["thermal"], output_dir=None)
+        if property_id is None:
+            property_id = uuid.uuid4().hex
+        self.record_observations(property_id, extracted)
         
-        return response.choices[0].message.content
+        return {
+            "report": ''.join(parts),
+            "extracted": extracted,
+            "merged": merged,
+            "stats": stats,
+            "chart_png": chart_png,
+            "metadata": build_metadata(input_files, metrics, stats),
+            "metrics": metrics,
+        }
+    
+    def record_observations(self, property_id, extracted):
+        """Append a run's extracted observations to the portfolio store, if one is configured"""
+        if self.observation_store is None:
+            return None
+        return self.observation_store.append(property_id, extracted)
     
     def save_report(self, report, filepath):
         """Save the generated report"""
         with open(filepath, 'w', encoding='utf-8') as f:
             f.write(report)
         print(f"Report saved to: {filepath}")
+    
+    def save_report_stream(self, chunks, filepath):
+        """Write report chunks to disk as they arrive, passing each one through to the caller"""
+        with open(filepath, 'w', encoding='utf-8') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                f.flush()
+                yield chunk
+        print(f"Report saved to: {filepath}")
 
-def generate_metadata():
-    """Add professional metadata"""
+def models_used(metrics):
+    """{stage: model} from a metrics record; a stage served by several models maps to a list"""
+    if metrics is None:
+        return {}
+    return {
+        stage: next(iter(counts)) if len(counts) == 1 else sorted(counts)
+        for stage, counts in metrics.to_dict()["models"].items()
+    }
+
+def build_metadata(input_files=None, metrics=None, stats=None):
+    """Metadata record for one generated report"""
     metadata = {
         "generated_at": datetime.datetime.now().isoformat(),
         "generator_version": "1.0",
-        "model_used": "llama-3.3-70b-versatile",
-        "input_files": ["inspection_report.txt", "thermal_report.txt"],
+        "model_used": models_used(metrics),
+        "input_files": input_files or ["inspection_report.txt", "thermal_report.txt"],
         "output_files": [
             "generated_ddr.md",
             "severity_chart.png",
@@ -150,62 +690,230 @@ def generate_metadata():
             "metadata.json"
         ]
     }
+    if stats is not None:
+        metadata["statistics"] = stats
+    if metrics is not None:
+        metadata["metrics"] = metrics.to_dict()
+    return metadata
+
+def generate_metadata(output_dir="output", input_files=None, metrics=None):
+    """Add professional metadata"""
+    metadata = build_metadata(input_files, metrics)
     
-    with open('output/metadata.json', 'w') as f:
+    metadata_path = os.path.join(output_dir, 'metadata.json')
+    with open(metadata_path, 'w') as f:
         json.dump(metadata, f, indent=2)
     
-    print("✅ Metadata saved to output/metadata.json")
+    print(f"✅ Metadata saved to {metadata_path}")
     return metadata
 
-def main():
-    print("=== DDR Report Generator ===\n")
+def ddr_stage_graph(generator, inspection_path, thermal_path, output_dir="output"):
+    """The DDR pipeline as a StageGraph with its artifacts in output_dir/.artifacts
     
-    # Initialize generator
-    generator = DDRGenerator()
+    load → extract (per source) → merge → generate (streamed to the report
+    file), chart and stats (in parallel) → metadata. Loading fingerprints
+    the input files; extraction streams them (text or PDF) chunk by chunk.
+    Extraction is keyed on the extraction settings and models, generation
+    on the synthesis model and prompt budget, so changing either re-runs
+    only what depends on it.
+    """
+    from visualize import visualize_severity, generate_summary_stats, summary_stats, chart_dpi
     
-    # Load documents
-    inspection_path = "input/inspection_report.txt"
-    thermal_path = "input/thermal_report.txt"
+    paths = {"inspection": inspection_path, "thermal": thermal_path}
+    report_path = os.path.join(output_dir, "generated_ddr.md")
+    chart_path = os.path.join(output_dir, "severity_chart.png")
+    stats_path = os.path.join(output_dir, "statistics.json")
+    router = generator.router
+    extract_config = content_hash([router.fast_model, router.large_model, router.escalate_chars, router.tiering,
+                                   generator.structured_output, generator.fast_path,
+                                   generator.fast_path_threshold, generator.chunk_chars])
     
-    print("Loading documents...")
-    inspection_text = generator.load_document(inspection_path)
-    thermal_text = generator.load_document(thermal_path)
+    def load(doc_type):
+        # Only the file's fingerprint is taken here; extraction streams the file itself
+        def run(inputs):
+            path = paths[doc_type]
+            if not os.path.isfile(path) or not os.path.getsize(path):
+                raise DocumentLoadError(f"Could not load input document: {path}")
+            with stage_timer("load"):
+                return {"path": path, "sha256": file_hash(path)}
+        return run
     
-    if not inspection_text or not thermal_text:
-        print("Error: Could not load input documents. Make sure they exist in the input/ folder")
-        return
+    def extract(doc_type):
+        def run(inputs):
+            # Timed as extract.<doc_type> inside; the two documents run concurrently
+            data = generator.extract_document(inputs[f"load.{doc_type}"]["path"], doc_type)
+            generator.score_readings({doc_type: data})
+            return data
+        return run
     
-    # Extract observations
-    inspection_data = generator.extract_observations(inspection_text, "inspection")
-    thermal_data = generator.extract_observations(thermal_text, "thermal")
+    def generate(inputs):
+        # The report is written as it streams in, next to the previous one, which it replaces once complete
+        chunks = generator.generate_ddr(inputs["merge"], stream=True,
+                                        stats=summary_stats(inputs["extract.inspection"], inputs["extract.thermal"]))
+        partial_path = f"{report_path}.partial"
+        parts = []
+        with open(partial_path, 'w', encoding='utf-8') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                f.flush()
+                parts.append(chunk)
+        os.replace(partial_path, report_path)
+        print(f"Report saved to: {report_path}")
+        return ''.join(parts)
     
-    # Merge observations
-    merged = generator.merge_observations(inspection_data, thermal_data)
+    def visualize(inputs):
+        print("\n📊 Generating visualizations and statistics...")
+        with stage_timer("visualize"):
+            visualize_severity(inputs["merge"], output_dir)
+        return chart_path
     
-    # Generate DDR (deduplication and conflict handling happens here via prompt)
-    ddr_report = generator.generate_ddr(merged)
+    def stats(inputs):
+        with stage_timer("stats"):
+            return generate_summary_stats(inputs["extract.inspection"], inputs["extract.thermal"], output_dir)
     
-    # Save report
-    output_path = "output/generated_ddr.md"
-    generator.save_report(ddr_report, output_path)
+    def metadata(inputs):
+        print("\n📝 Generating metadata...")
+        return generate_metadata(output_dir, [os.path.basename(path) for path in paths.values()],
+                                 current_metrics())
+    
+    stages = [Stage(f"load.{doc_type}", load(doc_type), always_run=True) for doc_type in paths]
+    stages += [Stage(f"extract.{doc_type}", extract(doc_type), [f"load.{doc_type}"], config=extract_config)
+               for doc_type in paths]
+    stages += [
+        Stage("merge", lambda inputs: generator.merge_observations(inputs["extract.inspection"],
+                                                                   inputs["extract.thermal"]),
+              ["extract.inspection", "extract.thermal"]),
+        Stage("generate", generate, ["merge", "extract.inspection", "extract.thermal"], version=3,
+              config=f"{router.synthesis_model}:{generator.prompt_token_budget}", outputs=[report_path]),
+        Stage("visualize", visualize, ["merge"], config=str(chart_dpi()), outputs=[chart_path]),
+        Stage("stats", stats, ["extract.inspection", "extract.thermal"], outputs=[stats_path]),
+        Stage("metadata", metadata, ["generate", "visualize", "stats"], always_run=True),
+    ]
+    return StageGraph(stages, ArtifactStore(os.path.join(output_dir, ".artifacts")))
+
+def process_property(generator, inspection_path, thermal_path, output_dir="output", prometheus=None,
+                     incremental=False, property_id=None, resume=True):
+    """Run the full pipeline for one property and write its outputs to output_dir
+    
+    The pipeline runs as a stage graph (see ddr_stage_graph) whose
+    intermediate results are kept in output_dir/.artifacts. With resume=True
+    (the default) stages whose artifacts are still valid are not run again,
+    so a run that failed part-way continues from the first missing stage.
+    
+    Stage timings and LLM usage are collected into a PipelineMetrics record
+    that is written into metadata.json, and into metrics.prom (Prometheus
+    text format) when prometheus=True or DDR_PROMETHEUS_METRICS is set.
+    
+    With incremental=True the previous run's state in output_dir is reused:
+    only report sections whose text changed are re-extracted, and a report
+    with few changed locations is patched section by section.
+    
+    Extracted observations are appended to the generator's portfolio store
+    under property_id, which defaults to the name of the folder holding the
+    inspection report. A resumed run that reused both extractions, or an
+    incremental run that re-extracted no section, records nothing new.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if prometheus is None:
+        prometheus = os.getenv('DDR_PROMETHEUS_METRICS', '').lower() in ('1', 'true', 'yes')
+    if property_id is None:
+        property_id = os.path.basename(os.path.dirname(os.path.abspath(inspection_path)))
+    report_path = os.path.join(output_dir, "generated_ddr.md")
+    
+    metrics = PipelineMetrics()
+    with metrics.activate():
+        if incremental:
+            extracted, merged, stats, reextracted = _process_incremental(
+                generator, inspection_path, thermal_path, output_dir, report_path
+            )
+            if reextracted:
+                generator.record_observations(property_id, extracted)
+            print("\n📝 Generating metadata...")
+            metadata = generate_metadata(
+                output_dir, [os.path.basename(inspection_path), os.path.basename(thermal_path)], metrics
+            )
+        else:
+            graph = ddr_stage_graph(generator, inspection_path, thermal_path, output_dir)
+            results = graph.run(resume)
+            if graph.reused:
+                print(f"⏩ Reused {len(graph.reused)} stages from the previous run: {', '.join(graph.reused)}")
+            extracted = {doc_type: results[f"extract.{doc_type}"] for doc_type in ("inspection", "thermal")}
+            if any(name.startswith("extract.") for name in graph.ran):
+                generator.record_observations(property_id, extracted)
+            merged, stats, metadata = results["merge"], results["stats"], results["metadata"]
+    
+    if prometheus:
+        metrics.write_prometheus(os.path.join(output_dir, "metrics.prom"), {"output_dir": output_dir})
+    
+    return {
+        "report_path": report_path,
+        "merged": merged,
+        "stats": stats,
+        "metadata": metadata,
+        "metrics": metrics,
+    }
+
+def _process_incremental(generator, inspection_path, thermal_path, output_dir, report_path):
+    """The --incremental pipeline: returns (extracted, merged, stats, sections re-extracted)"""
+    print("Loading documents...")
+    with stage_timer("load"):
+        inspection_text = generator.load_document(inspection_path)
+        thermal_text = generator.load_document(thermal_path)
+    
+    if not inspection_text or not thermal_text:
+        raise DocumentLoadError(f"Could not load input documents: {inspection_path}, {thermal_path}")
+    
+    documents = {"inspection": inspection_text, "thermal": thermal_text}
+    run = IncrementalRun(generator, os.path.join(output_dir, ".ddr_state.json"))
+    with stage_timer("extract"):
+        extracted = run.extract(documents)
+    generator.score_readings(extracted)
+    merged = generator.merge_observations(*extracted.values())
+    from visualize import visualize_severity, generate_summary_stats, summary_stats
+    run.update_report(merged, report_path, summary_stats(extracted["inspection"], extracted["thermal"]))
+    run.save()
     
-    # Generate visualizations
     print("\n📊 Generating visualizations and statistics...")
-    from visualize import visualize_severity, generate_summary_stats
-    visualize_severity(merged)
-    stats = generate_summary_stats(inspection_data, thermal_data)
+    with stage_timer("visualize"):
+        visualize_severity(merged, output_dir)
+    with stage_timer("stats"):
+        stats = generate_summary_stats(extracted["inspection"], extracted["thermal"], output_dir)
+    return extracted, merged, stats, run.stats["reextracted_sections"]
+
+def main():
+    print("=== DDR Report Generator ===\n")
+    
+    parser = argparse.ArgumentParser(description="Generate a DDR report from input/")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only re-extract and regenerate what changed since the last run")
+    parser.add_argument("--fresh", action="store_true",
+                        help="Run every stage again instead of resuming from saved artifacts")
+    args = parser.parse_args()
+    
+    # Initialize generator
+    generator = DDRGenerator()
     
-    # Generate metadata
-    print("\n📝 Generating metadata...")
-    metadata = generate_metadata()
+    try:
+        result = process_property(generator, "input/inspection_report.txt", "input/thermal_report.txt",
+                                  incremental=args.incremental, resume=not args.fresh)
+    except DocumentLoadError as e:
+        print(f"Error: {e}. Make sure they exist in the input/ folder")
+        return
     
     print("\n" + "="*60)
     print("✅ ALL OUTPUTS GENERATED SUCCESSFULLY!")
     print("="*60)
-    print(f"📄 DDR Report: {output_path}")
+    print(f"📄 DDR Report: {result['report_path']}")
     print(f"📊 Severity Chart: output/severity_chart.png")
     print(f"📈 Statistics: output/statistics.json")
     print(f"📋 Metadata: output/metadata.json")
+    cache_stats = generator.cache.stats()
+    print(f"💾 LLM cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    llm_totals = result['metrics'].to_dict()['llm_totals']
+    print(f"🔁 LLM requests: {llm_totals['requests']} ({llm_totals['retries']} retries, {llm_totals['hedges']} hedged)")
+    print("⏱️  Stage timings:")
+    for name, timing in result['metrics'].to_dict()['stages'].items():
+        print(f"   {name}: {timing['seconds']:.2f}s")
     print("="*60)
     
     print("\nKey features implemented:")
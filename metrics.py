@@ -0,0 +1,177 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# The metrics record for the pipeline run in progress, if any. Context
+# variables follow asyncio tasks and asyncio.to_thread, so concurrent runs
+# (batch mode, several Streamlit sessions) each see their own record.
+_current = contextvars.ContextVar('ddr_metrics', default=None)
+
+
+class PipelineMetrics:
+    """Per-run stage timings, LLM token usage, request/retry/hedge counts, models used"""
+
+    def __init__(self):
+        self.stages = {}
+        self.llm = {}
+        self.models = {}
+        self.info = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        """Make this the record that LLM calls and stage timers report into"""
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block of work under the given stage name"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            entry = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+            entry["seconds"] += seconds
+            entry["calls"] += 1
+
+    def _llm_entry(self, stage):
+        return self.llm.setdefault(stage, {
+            "requests": 0, "cache_hits": 0, "retries": 0, "hedges": 0,
+            "invalid_outputs": 0, "remainder_requests": 0, "escalations": 0,
+            "prompt_tokens": 0, "completion_tokens": 0,
+        })
+
+    def record_request(self, stage, usage=None):
+        """Count one API request and its usage (prompt/completion tokens) if the provider reported it"""
+        with self._lock:
+            entry = self._llm_entry(stage)
+            entry["requests"] += 1
+            if usage is not None:
+                entry["prompt_tokens"] += getattr(usage, 'prompt_tokens', 0) or 0
+                entry["completion_tokens"] += getattr(usage, 'completion_tokens', 0) or 0
+
+    def annotate(self, key, value):
+        """Attach a free-form value (e.g. prompt size) to the record"""
+        with self._lock:
+            self.info[key] = value
+
+    def record_cache_hit(self, stage):
+        with self._lock:
+            self._llm_entry(stage)["cache_hits"] += 1
+
+    def record_retry(self, stage, count=1):
+        with self._lock:
+            self._llm_entry(stage)["retries"] += count
+
+    def record_hedge(self, stage, count=1):
+        with self._lock:
+            self._llm_entry(stage)["hedges"] += count
+
+    def record_invalid_output(self, stage, count=1):
+        """Count structured outputs (objects or whole responses) that failed validation"""
+        with self._lock:
+            self._llm_entry(stage)["invalid_outputs"] += count
+
+    def record_remainder_request(self, stage, count=1):
+        """Count follow-up requests for only the part of an output that was missing"""
+        with self._lock:
+            self._llm_entry(stage)["remainder_requests"] += count
+
+    def record_escalation(self, stage, count=1):
+        """Count requests re-sent to a larger model after a smaller model's output failed"""
+        with self._lock:
+            self._llm_entry(stage)["escalations"] += count
+
+    def record_model(self, stage, model):
+        """Count one LLM call (request or cache hit) served by model"""
+        with self._lock:
+            stage_models = self.models.setdefault(stage, {})
+            stage_models[model] = stage_models.get(model, 0) + 1
+
+    def to_dict(self):
+        """Structured metrics record for metadata.json"""
+        with self._lock:
+            llm = {stage: dict(entry) for stage, entry in self.llm.items()}
+            totals = {key: sum(entry[key] for entry in llm.values())
+                      for key in ("requests", "cache_hits", "retries", "hedges", "invalid_outputs",
+                                  "remainder_requests", "escalations", "prompt_tokens", "completion_tokens")}
+            return {
+                "stages": {
+                    name: {"seconds": round(entry["seconds"], 4), "calls": entry["calls"]}
+                    for name, entry in self.stages.items()
+                },
+                "llm": llm,
+                "llm_totals": totals,
+                "models": {stage: dict(counts) for stage, counts in self.models.items()},
+                **self.info,
+            }
+
+    def to_prometheus(self, labels=None):
+        """Render the record in the Prometheus text exposition format"""
+        data = self.to_dict()
+        base = ''.join(f',{key}="{value}"' for key, value in sorted((labels or {}).items()))
+        lines = [
+            "# HELP ddr_stage_duration_seconds Wall-clock time spent in each pipeline stage",
+            "# TYPE ddr_stage_duration_seconds gauge",
+        ]
+        for name, entry in data["stages"].items():
+            lines.append(f'ddr_stage_duration_seconds{{stage="{name}"{base}}} {entry["seconds"]}')
+
+        counters = [
+            ("ddr_llm_requests_total", "requests", "LLM API requests sent"),
+            ("ddr_llm_cache_hits_total", "cache_hits", "LLM calls answered from the response cache"),
+            ("ddr_llm_retries_total", "retries", "LLM request retries"),
+            ("ddr_llm_hedges_total", "hedges", "Hedged (duplicate) LLM requests sent"),
+            ("ddr_llm_invalid_outputs_total", "invalid_outputs", "Structured LLM outputs that failed validation"),
+            ("ddr_llm_remainder_requests_total", "remainder_requests",
+             "Follow-up LLM requests for the missing part of a structured output"),
+            ("ddr_llm_escalations_total", "escalations", "LLM requests escalated to a larger model"),
+            ("ddr_llm_prompt_tokens_total", "prompt_tokens", "Prompt tokens reported by the provider"),
+            ("ddr_llm_completion_tokens_total", "completion_tokens", "Completion tokens reported by the provider"),
+        ]
+        for metric, key, help_text in counters:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for stage, entry in data["llm"].items():
+                lines.append(f'{metric}{{stage="{stage}"{base}}} {entry[key]}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path, labels=None):
+        with open(path, 'w') as f:
+            f.write(self.to_prometheus(labels))
+
+
+def current_metrics():
+    """The active PipelineMetrics, or None outside an instrumented run"""
+    return _current.get()
+
+
+@contextmanager
+def stage_timer(name):
+    """Time a block under the active metrics record (no-op when none is active)"""
+    metrics = current_metrics()
+    if metrics is None:
+        yield
+        return
+    with metrics.stage(name):
+        yield
+
+
+def timed_iter(name, iterator):
+    """Yield from iterator, timing it under name from the first item to exhaustion"""
+    metrics = current_metrics()
+    started = time.perf_counter()
+    try:
+        yield from iterator
+    finally:
+        if metrics is not None:
+            metrics.add_time(name, time.perf_counter() - started)
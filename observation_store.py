@@ -0,0 +1,202 @@
+import os
+import re
+import time
+import uuid
+import sqlite3
+import argparse
+import datetime
+import contextlib
+
+from dedup import room_type
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    property TEXT NOT NULL,
+    recorded_at TEXT NOT NULL,
+    source TEXT,
+    location TEXT,
+    room_type TEXT NOT NULL,
+    severity TEXT NOT NULL,
+    issue TEXT,
+    issue_key TEXT,
+    details TEXT
+);
+CREATE INDEX IF NOT EXISTS observations_property ON observations (property, recorded_at);
+CREATE INDEX IF NOT EXISTS observations_location ON observations (location);
+CREATE INDEX IF NOT EXISTS observations_room_severity ON observations (room_type, severity);
+CREATE INDEX IF NOT EXISTS observations_severity ON observations (severity);
+CREATE INDEX IF NOT EXISTS observations_recorded_at ON observations (recorded_at, severity);
+CREATE INDEX IF NOT EXISTS observations_issue ON observations (issue_key, room_type, property, severity);
+CREATE INDEX IF NOT EXISTS observations_run ON observations (run_id);
+CREATE VIEW IF NOT EXISTS latest_observations AS
+    SELECT * FROM observations WHERE run_id IN (
+        SELECT (SELECT run_id FROM observations AS runs WHERE runs.property = properties.property
+                ORDER BY recorded_at DESC, id DESC LIMIT 1)
+        FROM (SELECT DISTINCT property FROM observations) AS properties
+    );
+"""
+SEVERITIES = ("high", "medium", "low")
+# recorded_at is ISO 8601 text, so most periods are a prefix of it (cheaper than strftime)
+PERIOD_EXPRESSIONS = {
+    "day": "substr(recorded_at, 1, 10)",
+    "week": "strftime('%Y-W%W', recorded_at)",
+    "month": "substr(recorded_at, 1, 7)",
+    "year": "substr(recorded_at, 1, 4)",
+}
+ISSUE_NOISE = re.compile(r'[^a-z ]+')
+
+
+def issue_key(issue):
+    """Issue text with case, numbers and punctuation removed, so repeat findings group together"""
+    return ' '.join(ISSUE_NOISE.sub(' ', (issue or '').lower()).split())
+
+
+class ObservationStore:
+    """Portfolio-wide SQLite store of every extracted observation
+
+    Each pipeline run appends its observations tagged with a property id and
+    timestamp. Aggregates are computed by SQLite over indexed columns, so
+    portfolio dashboards stay fast across thousands of properties. Current-state
+    aggregates read only each property's latest run (the latest_observations
+    view), so re-inspecting a property does not count its findings twice.
+    """
+
+    def __init__(self, db_path=".cache/observations.db"):
+        self.db_path = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def append(self, property_id, extracted, recorded_at=None, run_id=None):
+        """Store one run's observations; extracted maps document_type -> extracted data
+
+        Returns the run id the rows were stored under.
+        """
+        run_id = run_id or uuid.uuid4().hex
+        recorded_at = (recorded_at or datetime.datetime.now()).isoformat(timespec='seconds')
+        rows = [
+            (run_id, property_id, recorded_at, obs.get('source') or doc_type, obs.get('location'),
+             room_type(obs.get('location')), str(obs.get('severity') or 'unknown').lower(),
+             obs.get('issue'), issue_key(obs.get('issue')), obs.get('details'))
+            for doc_type, data in extracted.items()
+            for obs in data.get('observations', [])
+        ]
+        with self._connect() as conn, conn:
+            conn.executemany(
+                "INSERT INTO observations (run_id, property, recorded_at, source, location, room_type, "
+                "severity, issue, issue_key, details) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return run_id
+
+    def _query(self, sql, params=()):
+        with self._connect() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def summary(self):
+        """Portfolio totals: properties, runs, and observations (total and per severity) in latest runs"""
+        (properties, runs), = self._query("SELECT COUNT(DISTINCT property), COUNT(DISTINCT run_id) FROM observations")
+        (observations,), = self._query("SELECT COUNT(*) FROM latest_observations")
+        by_severity = dict(self._query("SELECT severity, COUNT(*) FROM latest_observations GROUP BY severity"))
+        return {"properties": properties, "runs": runs, "observations": observations,
+                "by_severity": by_severity}
+
+    def severity_by_room(self, property_id=None):
+        """{room_type: {severity: count}} as of the latest run, for one property or the whole portfolio"""
+        where, params = ("WHERE property = ?", (property_id,)) if property_id else ("", ())
+        distribution = {}
+        for room, severity, count in self._query(
+            f"SELECT room_type, severity, COUNT(*) FROM latest_observations {where} "
+            "GROUP BY room_type, severity ORDER BY room_type", params
+        ):
+            distribution.setdefault(room, {})[severity] = count
+        return distribution
+
+    def recurring_issues(self, min_properties=2, limit=20):
+        """Issues found in the same room type at several properties, most widespread first
+
+        Issues are reported by their normalized text (see issue_key), counted
+        over each property's latest run.
+        """
+        return [
+            {"room_type": room, "issue": issue, "properties": properties, "occurrences": occurrences,
+             "high": high}
+            for room, issue, properties, occurrences, high in self._query(
+                "SELECT room_type, issue_key, COUNT(DISTINCT property), COUNT(*), "
+                "SUM(severity = 'high') FROM latest_observations WHERE issue_key != '' "
+                "GROUP BY issue_key, room_type HAVING COUNT(DISTINCT property) >= ? "
+                "ORDER BY COUNT(DISTINCT property) DESC, COUNT(*) DESC LIMIT ?",
+                (min_properties, limit),
+            )
+        ]
+
+    def severity_trend(self, period="month", property_id=None):
+        """[{period, high, medium, low, other}] observation counts per time period, oldest first
+
+        Unlike the other aggregates this counts every run, not just the latest
+        per property, since each run is what was found in its period.
+        """
+        if period not in PERIOD_EXPRESSIONS:
+            raise ValueError(f"Unsupported period: {period}")
+        where, params = ("WHERE property = ?", (property_id,)) if property_id else ("", ())
+        rows = self._query(
+            f"SELECT {PERIOD_EXPRESSIONS[period]} AS bucket, "
+            "SUM(severity = 'high'), SUM(severity = 'medium'), SUM(severity = 'low'), "
+            f"SUM(severity NOT IN ('high', 'medium', 'low')) FROM observations {where} "
+            "GROUP BY bucket ORDER BY bucket", params
+        )
+        return [{"period": bucket, "high": high, "medium": medium, "low": low, "other": other}
+                for bucket, high, medium, low, other in rows]
+
+
+def store_from_env():
+    """Default store at DDR_OBSERVATION_DB (.cache/observations.db); "off" disables it"""
+    db_path = os.getenv('DDR_OBSERVATION_DB', '.cache/observations.db')
+    if db_path.lower() in ('', 'off', 'none', '0'):
+        return None
+    return ObservationStore(db_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Portfolio statistics from the observation store")
+    parser.add_argument("--db", default=os.getenv('DDR_OBSERVATION_DB', '.cache/observations.db'))
+    parser.add_argument("--property", help="Limit room and trend statistics to one property")
+    parser.add_argument("--period", default="month", choices=sorted(PERIOD_EXPRESSIONS))
+    args = parser.parse_args()
+
+    store = ObservationStore(args.db)
+    started = time.perf_counter()
+    summary = store.summary()
+    rooms = store.severity_by_room(args.property)
+    recurring = store.recurring_issues()
+    trend = store.severity_trend(args.period, args.property)
+    elapsed = time.perf_counter() - started
+
+    print(f"🏘️  {summary['properties']} properties, {summary['runs']} runs, "
+          f"{summary['observations']} observations")
+    print("\n📍 Severity by room type:")
+    for room, counts in rooms.items():
+        print(f"   {room}: " + ', '.join(f"{sev} {counts.get(sev, 0)}" for sev in SEVERITIES))
+    print("\n🔁 Recurring issues:")
+    for item in recurring:
+        print(f"   {item['room_type']}: {item['issue']} ({item['properties']} properties)")
+    print(f"\n📈 Trend by {args.period}:")
+    for row in trend:
+        print(f"   {row['period']}: high {row['high']}, medium {row['medium']}, low {row['low']}")
+    print(f"\n⏱️  Computed in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
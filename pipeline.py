@@ -0,0 +1,169 @@
+import os
+import json
+import hashlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from metrics import current_metrics
+
+ARTIFACT_VERSION = 1
+
+
+def content_hash(data):
+    """sha256 of a JSON-serializable value, independent of dict ordering"""
+    encoded = json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Stage:
+    """One node of a StageGraph
+
+    run is called with {dependency name: its data} and returns this stage's
+    data, which must be JSON-serializable. version and config (the model,
+    chart resolution, ...) are part of the artifact key, so changing either
+    re-runs the stage. outputs are the files the stage writes; its artifact
+    is only reused while they exist unchanged. always_run stages (loading the
+    inputs, writing metadata) run every time and only the hash of their
+    data is stored.
+    """
+
+    def __init__(self, name, run, deps=(), version=1, config="", outputs=(), always_run=False):
+        self.name = name
+        self.run = run
+        self.deps = tuple(deps)
+        self.version = version
+        self.config = config
+        self.outputs = tuple(outputs)
+        self.always_run = always_run
+
+
+class ArtifactStore:
+    """Versioned, content-hashed stage outputs, one JSON file per stage
+
+    An artifact records the key it was produced under (stage version, config
+    and the content hashes of its inputs), the hash of its data and of every
+    output file. It is valid only if all of them still match.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.directory, f"{name}.json")
+
+    def load(self, stage, key):
+        """The stage's artifact for key, or None when it is missing or invalid"""
+        try:
+            with open(self.path(stage.name), 'r', encoding='utf-8') as f:
+                artifact = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if artifact.get("version") != ARTIFACT_VERSION or artifact.get("key") != key:
+            return None
+        if "data" not in artifact or content_hash(artifact["data"]) != artifact.get("hash"):
+            return None
+        for path, digest in artifact.get("files", {}).items():
+            if not os.path.exists(path) or file_hash(path) != digest:
+                return None
+        return artifact
+
+    def save(self, stage, key, data):
+        artifact = {
+            "version": ARTIFACT_VERSION,
+            "stage": stage.name,
+            "stage_version": stage.version,
+            "key": key,
+            "hash": content_hash(data),
+            "files": {path: file_hash(path) for path in stage.outputs},
+        }
+        if not stage.always_run:
+            artifact["data"] = data
+        tmp_path = f"{self.path(stage.name)}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(artifact, f)
+        os.replace(tmp_path, self.path(stage.name))
+        return artifact
+
+
+class StageGraph:
+    """Run stages in dependency order, in parallel where they are independent
+
+    Before a stage runs its artifact is looked up under a key derived from
+    its inputs' content hashes; a valid artifact is reused instead of running
+    it, so a failed or interrupted run resumes from the first stage that is
+    missing or invalid. A stage whose inputs were recomputed but came out
+    identical is still reused.
+    """
+
+    def __init__(self, stages, store, max_workers=4):
+        self.stages = {stage.name: stage for stage in stages}
+        self.store = store
+        self.max_workers = max_workers
+        self.ran = []
+        self.reused = []
+
+    def _key(self, stage, hashes):
+        return content_hash([stage.name, stage.version, stage.config, [hashes[dep] for dep in stage.deps]])
+
+    def _annotate(self):
+        metrics = current_metrics()
+        if metrics:
+            metrics.annotate("pipeline", {"ran": list(self.ran), "reused": list(self.reused)})
+
+    def run(self, resume=True):
+        """Run every stage (reusing valid artifacts when resume is set); returns {stage name: data}
+
+        If a stage fails, the stages already running are allowed to finish
+        (so their artifacts are kept for the next run) and the first error is
+        raised.
+        """
+        results, hashes = {}, {}
+        pending = dict(self.stages)
+        running = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                ready = [stage for stage in pending.values()
+                         if error is None and all(dep in hashes for dep in stage.deps)]
+                for stage in ready:
+                    del pending[stage.name]
+                    key = self._key(stage, hashes)
+                    artifact = self.store.load(stage, key) if resume and not stage.always_run else None
+                    if artifact is not None:
+                        results[stage.name], hashes[stage.name] = artifact["data"], artifact["hash"]
+                        self.reused.append(stage.name)
+                        continue
+                    inputs = {dep: results[dep] for dep in stage.deps}
+                    # Each stage gets a copy of the caller's context so it reports into its metrics
+                    future = pool.submit(contextvars.copy_context().run, stage.run, inputs)
+                    running[future] = (stage, key)
+                if ready and any(stage.name in hashes for stage in ready):
+                    self._annotate()
+                    continue  # reused artifacts may have unblocked more stages
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, key = running.pop(future)
+                    try:
+                        data = future.result()
+                    except Exception as e:
+                        print(f"❌ Stage {stage.name} failed: {e}")
+                        error = error or e
+                        continue
+                    results[stage.name] = data
+                    hashes[stage.name] = self.store.save(stage, key, data)["hash"]
+                    self.ran.append(stage.name)
+                self._annotate()
+        if error is not None:
+            raise error
+        return results
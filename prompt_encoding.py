@@ -0,0 +1,106 @@
+import json
+import math
+
+COLUMNS = ["severity", "sources", "areas", "issue", "details"]
+LOW_PRIORITY = ('low', 'unknown', '')
+
+
+def estimate_tokens(text):
+    """Cheap local token estimate (~4 characters per token for English/JSON text)"""
+    return math.ceil(len(text) / 4)
+
+
+def _cell(value):
+    if isinstance(value, (list, tuple)):
+        value = '+'.join(str(v) for v in value)
+    return ' '.join(str(value or '').split()).replace('|', '/')
+
+
+def _row(record):
+    sources = record.get('sources') or record.get('source') or ''
+    return '|'.join([
+        _cell(str(record.get('severity', '')).lower()),
+        _cell(sources),
+        _cell(record.get('areas', '')),
+        _cell(record.get('issue', '')),
+        _cell(record.get('details', '')),
+    ])
+
+
+def encode_observations(merged_observations):
+    """Compact tabular encoding: one pipe-separated table per location, keys written once"""
+    lines = ['|'.join(COLUMNS)]
+    for location, records in merged_observations.items():
+        if not records:
+            continue
+        lines.append(f"## {_cell(location)}")
+        lines.extend(_row(record) for record in records)
+    return '\n'.join(lines)
+
+
+def apply_budget(merged_observations, max_tokens):
+    """Trim low-severity observations until the encoded payload fits in max_tokens
+
+    First long low-severity details are shortened, then low-severity records
+    are dropped (lowest-priority locations last) and summarised in a single
+    note. High and medium severity observations are never removed.
+
+    Returns (merged_observations, omitted_note).
+    """
+    if estimate_tokens(encode_observations(merged_observations)) <= max_tokens:
+        return merged_observations, ""
+
+    trimmed = {
+        location: [
+            dict(record, details=_cell(record.get('details', ''))[:80])
+            if str(record.get('severity', '')).lower() in LOW_PRIORITY else record
+            for record in records
+        ]
+        for location, records in merged_observations.items()
+    }
+    if estimate_tokens(encode_observations(trimmed)) <= max_tokens:
+        return trimmed, ""
+
+    # Track the encoded size incrementally so trimming stays linear in the number of records
+    size = len(encode_observations(trimmed))
+    limit = max_tokens * 4
+    omitted_locations = {}
+    # Drop from the end so the rooms listed first keep their low-severity context longest
+    for location in reversed(list(trimmed)):
+        if size <= limit:
+            break
+        kept = []
+        for record in reversed(trimmed[location]):
+            if size > limit and str(record.get('severity', '')).lower() in LOW_PRIORITY:
+                size -= len(_row(record)) + 1
+                omitted_locations[location] = omitted_locations.get(location, 0) + 1
+            else:
+                kept.append(record)
+        trimmed[location] = kept[::-1]
+
+    omitted = sum(omitted_locations.values())
+    note = ""
+    if omitted:
+        where = ', '.join(f"{location} ({count})" for location, count in omitted_locations.items())
+        note = f"{omitted} low-severity observations omitted for brevity: {where}"
+    return trimmed, note
+
+
+def build_observation_payload(merged_observations, token_budget=6000):
+    """Encode merged observations for the synthesis prompt within a token budget
+
+    Returns (payload_text, stats) where stats reports the encoded size against
+    the old indented-JSON encoding.
+    """
+    budgeted, note = apply_budget(merged_observations, token_budget)
+    payload = encode_observations(budgeted)
+    if note:
+        payload += f"\nNOTE: {note}"
+    stats = {
+        "format": "table",
+        "prompt_tokens_estimate": estimate_tokens(payload),
+        "json_tokens_estimate": estimate_tokens(json.dumps(merged_observations, indent=2)),
+        "token_budget": token_budget,
+        "omitted_note": note,
+    }
+    return payload, stats
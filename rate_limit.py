@@ -0,0 +1,61 @@
+import time
+import threading
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at rate_per_minute"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+
+    def reserve(self, amount):
+        """Take amount tokens now and return how long to wait before they are really available"""
+        with self._lock:
+            self._refill()
+            # Requests larger than the bucket can never fit; cap them so they just wait for a full bucket
+            amount = min(amount, self.capacity)
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate_per_second
+
+    def acquire(self, amount=1):
+        """Block until amount tokens are available"""
+        wait = self.reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits for LLM calls"""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    @staticmethod
+    def estimate_tokens(prompt, max_tokens):
+        """Rough token cost of a call: ~4 characters per prompt token plus the output budget"""
+        return len(prompt) // 4 + max_tokens
+
+    def acquire(self, prompt, max_tokens):
+        """Block until both buckets allow this call; returns seconds spent waiting"""
+        waits = [0.0]
+        if self.requests:
+            waits.append(self.requests.reserve(1))
+        if self.tokens:
+            waits.append(self.tokens.reserve(self.estimate_tokens(prompt, max_tokens)))
+        wait = max(waits)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
@@ -0,0 +1,184 @@
+import re
+
+from dedup import SEVERITY_RANK
+from thermal import DIFFERENTIAL_THRESHOLD_F, MEDIUM_DIFFERENTIAL_F
+
+SECTION_TITLES = {
+    "1": "Property Issue Summary",
+    "2": "Area-wise Observations",
+    "3": "Probable Root Cause",
+    "4": "Severity Assessment",
+    "5": "Recommended Actions",
+    "6": "Additional Notes",
+    "7": "Missing or Unclear Information",
+}
+# Written by the LLM; every other section is rendered from the merged data
+NARRATIVE_SECTIONS = ("1", "3", "5")
+LOCAL_SECTIONS = ("2", "4", "6", "7")
+SEVERITY_ORDER = ("high", "medium", "low", "unknown")
+HEADER_LINE = re.compile(r'^# (\d+)\.')
+HEADER_PREFIX = re.compile(r'(?:#(?: \d*)?)?')
+
+
+def _header(number):
+    return f"# {number}. {SECTION_TITLES[number]}"
+
+
+def _cell(value):
+    if isinstance(value, (list, tuple)):
+        value = ', '.join(str(v) for v in value)
+    return ' '.join(str(value or '').split()).replace('|', '\\|')
+
+
+def _severity(record):
+    severity = str(record.get('severity') or 'unknown').lower()
+    return severity if severity in SEVERITY_RANK else 'unknown'
+
+
+def render_area_wise(merged):
+    """Section 2: one table of defects per location, in the order locations were merged"""
+    lines = [_header("2"), ""]
+    for location, records in merged.items():
+        if not records:
+            continue
+        lines += [f"## {_cell(location)}", "", "| Severity | Issue | Details | Sources |", "|---|---|---|---|"]
+        lines += [
+            f"| {_severity(record).title()} | {_cell(record.get('issue')) or 'Not Available'} | "
+            f"{_cell(record.get('details')) or 'Not Available'} | "
+            f"{_cell(record.get('sources') or record.get('source')) or 'Not Available'} |"
+            for record in records
+        ]
+        lines.append("")
+    if len(lines) == 2:
+        lines += ["No observations were extracted.", ""]
+    return '\n'.join(lines)
+
+
+def render_severity(merged):
+    """Section 4: defect counts and locations per severity, then the high-severity defects"""
+    by_severity = {severity: [] for severity in SEVERITY_ORDER}
+    for location, records in merged.items():
+        for record in records:
+            by_severity[_severity(record)].append((location, record))
+
+    lines = [
+        _header("4"), "",
+        "Severities are as stated in the reports, except thermal findings with temperature readings, which "
+        f"are rated from the measured differential (High from {DIFFERENTIAL_THRESHOLD_F:g}°F, Medium from "
+        f"{MEDIUM_DIFFERENTIAL_F:g}°F). A defect seen in several reports takes the highest severity.", "",
+        "| Severity | Defects | Locations |", "|---|---|---|",
+    ]
+    for severity in SEVERITY_ORDER:
+        entries = by_severity[severity]
+        if not entries and severity == 'unknown':
+            continue
+        locations = list(dict.fromkeys(location for location, _ in entries))
+        lines.append(f"| {severity.title()} | {len(entries)} | {_cell(locations) or '-'} |")
+    if by_severity['high']:
+        lines += ["", "High severity defects:"]
+        lines += [f"- **{_cell(location)}**: {_cell(record.get('issue'))}"
+                  for location, record in by_severity['high']]
+    lines.append("")
+    return '\n'.join(lines)
+
+
+def render_notes(merged, stats=None, omitted_note=""):
+    """Section 6: what the report was built from"""
+    records = [record for location_records in merged.values() for record in location_records]
+    findings = sum(record.get('finding_count', 1) for record in records)
+    lines = [_header("6"), ""]
+    if stats:
+        lines.append(f"- Observations extracted: inspection {stats['total_inspection_observations']}, "
+                     f"thermal {stats['total_thermal_observations']} "
+                     f"({stats['unique_locations']} locations as named in the reports)")
+    lines.append(f"- Locations: {len(merged)}; distinct defects: {len(records)}; findings combined: {findings}")
+    confirmed = sum(1 for record in records if len(record.get('sources') or []) > 1)
+    if confirmed:
+        lines.append(f"- Defects confirmed by more than one report: {confirmed}")
+    if omitted_note:
+        lines.append(f"- {omitted_note}")
+    lines.append("")
+    return '\n'.join(lines)
+
+
+def render_missing(merged, stats=None):
+    """Section 7: fields the source reports did not provide"""
+    lines = [_header("7"), ""]
+    if stats:
+        for doc_type in ("inspection", "thermal"):
+            if not stats.get(f"total_{doc_type}_observations"):
+                lines.append(f"- No observations could be extracted from the {doc_type} report")
+    for location, records in merged.items():
+        for record in records:
+            missing = []
+            if _severity(record) == 'unknown':
+                missing.append("severity")
+            if not str(record.get('details') or '').strip():
+                missing.append("measurements/details")
+            if missing:
+                lines.append(f"- {_cell(location)} – {_cell(record.get('issue')) or 'issue'}: "
+                             f"{' and '.join(missing)} Not Available")
+    if len(lines) == 2:
+        lines.append("Not Available – every observation includes a severity and supporting details.")
+    lines.append("")
+    return '\n'.join(lines)
+
+
+def render_local_sections(merged, stats=None, omitted_note=""):
+    """{section number: text} for every section rendered from the data rather than the LLM"""
+    return {
+        "2": render_area_wise(merged),
+        "4": render_severity(merged),
+        "6": render_notes(merged, stats, omitted_note),
+        "7": render_missing(merged, stats),
+    }
+
+
+def splice_stream(chunks, local_sections):
+    """Interleave LLM-written sections with locally rendered ones, in section order
+
+    chunks is the LLM's text (streamed or whole). Text is passed through as
+    it arrives; only the start of a line is held back until it is clear
+    whether it is a section header. Each local section is emitted just
+    before the first header with a higher number, the rest at the end. If
+    the LLM writes a section that is rendered locally anyway, its text is
+    dropped.
+    """
+    pending = sorted(local_sections, key=int)
+    # line is the undecided start of the current line, None once it is known not to be a header
+    state = {"skipping": False, "last": "\n\n", "line": ""}
+
+    def emit(text):
+        state["last"] = (state["last"] + text)[-2:]
+        return text
+
+    def emit_local(before=None):
+        while pending and (before is None or int(pending[0]) < before):
+            separator = '' if state["last"] == '\n\n' else '\n' if state["last"].endswith('\n') else '\n\n'
+            yield emit(separator + local_sections[pending.pop(0)].rstrip() + '\n\n')
+
+    def decide(line):
+        header = HEADER_LINE.match(line)
+        if header:
+            yield from emit_local(int(header.group(1)))
+            state["skipping"] = header.group(1) in local_sections
+        if not state["skipping"]:
+            yield emit(line)
+
+    for chunk in chunks:
+        while chunk:
+            newline = chunk.find('\n')
+            piece, chunk = (chunk, '') if newline < 0 else (chunk[:newline + 1], chunk[newline + 1:])
+            if state["line"] is None:
+                if not state["skipping"]:
+                    yield emit(piece)
+            else:
+                line = state["line"] + piece
+                if newline < 0 and HEADER_PREFIX.fullmatch(line):
+                    state["line"] = line
+                    continue
+                yield from decide(line)
+            state["line"] = '' if newline >= 0 else None
+    if state["line"]:
+        yield from decide(state["line"])
+    yield from emit_local()
@@ -0,0 +1,173 @@
+import os
+import time
+import random
+import datetime
+import threading
+import contextvars
+import email.utils
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import groq
+from metrics import current_metrics
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+# Shared by every ResilientCaller; hedged attempts run here so the caller can wait on whichever finishes first
+_attempt_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-attempt")
+
+
+class RetryPolicy:
+    """Deadlines, backoff and hedging settings for LLM calls
+
+    deadline         total seconds a call may take across all attempts
+    attempt_timeout  seconds a single attempt may take (capped by what is left of the deadline)
+    max_retries      attempts after the first one for 429/5xx/timeouts/connection errors
+    base_delay, max_delay  exponential backoff with full jitter, unless the
+                     provider sends retry-after
+    hedge            send a second request if the first has not answered by
+                     the observed p95 latency (hedge_after seconds until enough
+                     samples exist), and take whichever answers first
+    """
+
+    def __init__(self, deadline=180.0, attempt_timeout=90.0, max_retries=3, base_delay=0.5,
+                 max_delay=20.0, hedge=False, hedge_after=10.0, min_samples=20):
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self.min_samples = min_samples
+
+    @classmethod
+    def from_env(cls):
+        """Policy from DDR_LLM_DEADLINE, DDR_LLM_MAX_RETRIES and DDR_LLM_HEDGE"""
+        return cls(
+            deadline=float(os.getenv('DDR_LLM_DEADLINE', '180')),
+            max_retries=int(os.getenv('DDR_LLM_MAX_RETRIES', '3')),
+            hedge=os.getenv('DDR_LLM_HEDGE', '').lower() in ('1', 'true', 'yes'),
+        )
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies, per stage"""
+
+    def __init__(self, window=200):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._samples.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, stage, pct, min_samples=1):
+        with self._lock:
+            samples = sorted(self._samples.get(stage, ()))
+        if len(samples) < min_samples or not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100.0))]
+
+
+def is_retryable(exc):
+    """Rate limits, server errors, timeouts and dropped connections are worth another attempt"""
+    if isinstance(exc, (groq.APITimeoutError, groq.APIConnectionError)):
+        return True
+    if isinstance(exc, groq.APIStatusError):
+        return exc.status_code in RETRYABLE_STATUS
+    return False
+
+
+def retry_after_seconds(exc):
+    """Delay requested by the provider through retry-after / retry-after-ms, if any"""
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    if headers.get('retry-after-ms'):
+        try:
+            return float(headers['retry-after-ms']) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None  # Unparseable; the caller falls back to jittered backoff
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, parsed.timestamp() - time.time())
+
+
+class ResilientCaller:
+    """Runs LLM requests under a RetryPolicy and reports retries/hedges to the active metrics"""
+
+    def __init__(self, policy=None, tracker=None):
+        self.policy = policy or RetryPolicy()
+        self.tracker = tracker or LatencyTracker()
+
+    def backoff(self, attempt, exc):
+        requested = retry_after_seconds(exc)
+        if requested is not None:
+            return min(requested, self.policy.max_delay)
+        return random.uniform(0, min(self.policy.max_delay, self.policy.base_delay * 2 ** attempt))
+
+    def hedge_delay(self, stage):
+        p95 = self.tracker.percentile(stage, 95, self.policy.min_samples)
+        return p95 if p95 is not None else self.policy.hedge_after
+
+    def call(self, send, stage="llm", hedge=None):
+        """Call send(timeout) until it succeeds, the retries run out or the deadline passes"""
+        policy = self.policy
+        hedge = policy.hedge if hedge is None else hedge
+        metrics = current_metrics()
+        deadline = time.monotonic() + policy.deadline
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            timeout = max(0.1, min(policy.attempt_timeout, remaining))
+            started = time.monotonic()
+            try:
+                if hedge:
+                    result = self._hedged(send, timeout, stage, metrics)
+                else:
+                    result = send(timeout)
+                self.tracker.record(stage, time.monotonic() - started)
+                return result
+            except Exception as exc:
+                if not is_retryable(exc) or attempt >= policy.max_retries:
+                    raise
+                delay = self.backoff(attempt, exc)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                attempt += 1
+                if metrics:
+                    metrics.record_retry(stage)
+                print(f"   ⚠️ {stage} request failed ({exc.__class__.__name__}), retry {attempt} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _hedged(self, send, timeout, stage, metrics):
+        """Start one attempt and, if it is slower than usual, a second; first success wins"""
+        futures = [_attempt_pool.submit(contextvars.copy_context().run, send, timeout)]
+        done, _ = wait(futures, timeout=self.hedge_delay(stage))
+        if not done:
+            if metrics:
+                metrics.record_hedge(stage)
+            futures.append(_attempt_pool.submit(contextvars.copy_context().run, send, timeout))
+
+        error = None
+        pending = futures
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # The slower attempt keeps running in the background; its result is discarded
+                    return future.result()
+                error = future.exception()
+        raise error
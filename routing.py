@@ -0,0 +1,51 @@
+import os
+
+FAST_MODEL = "llama-3.1-8b-instant"
+LARGE_MODEL = "llama-3.3-70b-versatile"
+
+
+class ModelRouter:
+    """Which model serves each kind of LLM request
+
+    fast_model      extraction of documents up to escalate_chars long
+    large_model     DDR synthesis, extraction of longer documents, and the
+                    follow-up request when a fast-model extraction fails
+                    validation
+    escalate_chars  document size (characters sent to the LLM) above which
+                    extraction goes straight to the large model
+    tiering         False sends everything to the large model
+    """
+
+    def __init__(self, fast_model=FAST_MODEL, large_model=LARGE_MODEL, escalate_chars=8000, tiering=True):
+        self.fast_model = fast_model
+        self.large_model = large_model
+        self.escalate_chars = escalate_chars
+        self.tiering = tiering
+
+    @classmethod
+    def from_env(cls):
+        """Router from DDR_FAST_MODEL, DDR_LARGE_MODEL, DDR_ESCALATE_CHARS and DDR_MODEL_TIERING"""
+        return cls(
+            fast_model=os.getenv('DDR_FAST_MODEL', FAST_MODEL),
+            large_model=os.getenv('DDR_LARGE_MODEL', LARGE_MODEL),
+            escalate_chars=int(os.getenv('DDR_ESCALATE_CHARS', '8000')),
+            tiering=os.getenv('DDR_MODEL_TIERING', '1').lower() not in ('0', 'false', 'no', 'off'),
+        )
+
+    def extraction_model(self, document_text):
+        """Model for extracting observations from document_text"""
+        return self.extraction_model_for_size(len(document_text))
+
+    def extraction_model_for_size(self, chars):
+        """Model for extracting `chars` characters of text, for callers that count it as it streams"""
+        if self.tiering and chars <= self.escalate_chars:
+            return self.fast_model
+        return self.large_model
+
+    def escalation_model(self, model):
+        """Model to retry with after model's output failed validation (None when already the largest)"""
+        return self.large_model if model != self.large_model else None
+
+    @property
+    def synthesis_model(self):
+        return self.large_model
@@ -0,0 +1,137 @@
+import re
+from chunking import split_sections, SUBHEADING_PATTERN, BULLET_PREFIXES
+
+SEVERITY_LINE = re.compile(r'^severity\s*[:\-]\s*(low|medium|moderate|high|critical)\b', re.IGNORECASE)
+SUBHEADING_LABEL = re.compile(r'\(([^)]*)\)')
+READING_PATTERN = re.compile(
+    r'\d+(?:\.\d+)?(?:\s*-\s*\d+(?:\.\d+)?)?\s*(?:°\s*[FC]|%|mm|cm|inches|inch|feet|ft|in\b)',
+    re.IGNORECASE,
+)
+PERCENT_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*%')
+DIFFERENTIAL_PATTERN = re.compile(r'(?:differential|drop)[^\d]*(\d+(?:\.\d+)?)\s*°\s*F', re.IGNORECASE)
+
+LOW_MARKERS = ('no ', 'normal', 'minor', 'cosmetic', 'dry ')
+HIGH_MARKERS = ('active', 'soft', 'mold', 'mould', 'structural', 'urgent', 'immediate', 'wet ',
+                'moisture damage', 'leak', 'water infiltration', 'water migration')
+SEVERITY_ALIASES = {'moderate': 'medium', 'critical': 'high'}
+# Moisture content above this is "concerning" per the inspection template
+MOISTURE_THRESHOLD = 15.0
+DIFFERENTIAL_THRESHOLD_F = 10.0
+
+
+def infer_severity(issue, details=''):
+    """Keyword/reading based severity for findings without an explicit Severity: line
+
+    Negations ("No active leak") are only looked for in the finding itself so
+    a reference reading in the details ("Dry insulation: 65°F") does not
+    downgrade it.
+    """
+    if any(marker in f" {issue.lower()} " for marker in LOW_MARKERS):
+        return "low"
+    text = f"{issue} {details}"
+    lowered = f" {text.lower()} "
+    percentages = [float(p) for p in PERCENT_PATTERN.findall(text)]
+    differentials = [float(d) for d in DIFFERENTIAL_PATTERN.findall(text)]
+    if any(p > MOISTURE_THRESHOLD for p in percentages) or any(d >= DIFFERENTIAL_THRESHOLD_F for d in differentials):
+        return "high"
+    if any(marker in lowered for marker in HIGH_MARKERS):
+        return "high"
+    return "medium"
+
+
+def _bullet_text(line):
+    return line.lstrip(''.join(BULLET_PREFIXES) + ' ').strip()
+
+
+def _parse_section(heading, body):
+    """Parse one location section into blocks of bullets
+
+    Returns (blocks, prose_lines, severity) where blocks is a list of
+    (sub_label, bullets) and severity is an explicit Severity: value or None.
+    """
+    blocks = []
+    current = None
+    prose = []
+    severity = None
+    for line in body.splitlines()[1:]:
+        stripped = line.strip()
+        if not stripped:
+            continue
+        severity_match = SEVERITY_LINE.match(stripped)
+        if severity_match:
+            value = severity_match.group(1).lower()
+            severity = SEVERITY_ALIASES.get(value, value)
+        elif SUBHEADING_PATTERN.match(stripped) and stripped.endswith(':'):
+            label = SUBHEADING_LABEL.search(stripped)
+            current = (label.group(1) if label else '', [])
+            blocks.append(current)
+        elif stripped.startswith(BULLET_PREFIXES):
+            if current is None:
+                current = (None, [])
+                blocks.append(current)
+            current[1].append(_bullet_text(stripped))
+        elif stripped.startswith('(') and stripped.endswith(')'):
+            # Parenthetical notes such as "(Note: Anything above 15% is concerning)"
+            continue
+        else:
+            prose.append(stripped)
+    return blocks, prose, severity
+
+
+def section_confidence(blocks, prose, severity):
+    """How sure we are that the rule parser captured the whole section"""
+    if not any(bullets for _, bullets in blocks):
+        return 0.0
+    confidence = 0.5
+    if not prose:
+        confidence += 0.3
+    confidence += 0.2 if severity else 0.1
+    return round(confidence, 2)
+
+
+def _observation(location, issue, details, severity, source, confidence):
+    return {
+        "location": location,
+        "issue": issue,
+        "severity": severity or infer_severity(issue, details),
+        "details": details,
+        "source": source,
+        "confidence": confidence,
+    }
+
+
+def parse_report(document_text, document_type, threshold=0.75):
+    """Deterministically parse a templated report
+
+    Returns (observations, leftover_text). Observations follow the
+    extract_observations schema plus a `confidence` score; leftover_text holds
+    the preamble and every section parsed with confidence below threshold
+    (empty when the whole report was handled), for the LLM to extract.
+    """
+    preamble, sections = split_sections(document_text)
+    observations = []
+    leftover = []
+    for heading, body in sections:
+        blocks, prose, severity = _parse_section(heading, body)
+        confidence = section_confidence(blocks, prose, severity)
+        if confidence < threshold:
+            leftover.append(body)
+            continue
+        for label, bullets in blocks:
+            if not bullets:
+                continue
+            if label is None:
+                # Plain bullet list: every bullet is its own finding
+                for bullet in bullets:
+                    details = ', '.join(READING_PATTERN.findall(bullet))
+                    observations.append(_observation(heading, bullet, details, severity, document_type, confidence))
+            else:
+                # Per-image block: first bullet is the finding, the rest are its readings
+                location = f"{heading} ({label})" if label else heading
+                details = '; '.join(bullets[1:])
+                observations.append(_observation(location, bullets[0], details, severity, document_type, confidence))
+
+    if not sections:
+        return [], document_text
+    leftover_text = '\n\n'.join([preamble] + leftover) if leftover else ''
+    return observations, leftover_text
@@ -0,0 +1,115 @@
+import json
+
+from rule_parser import SEVERITY_ALIASES
+
+JSON_MODE = {"type": "json_object"}
+SEVERITIES = ("low", "medium", "high")
+
+
+def validate_observation(obj, document_type):
+    """Check one extracted object against the observation schema
+
+    Returns the observation with exactly the schema's fields (location,
+    issue, severity, details, source) or None when it is unusable: not an
+    object, or missing a location or issue. Severity is normalized to
+    low/medium/high ("unknown" when unrecognized) and details to a string
+    (a list of strings is joined, anything else dropped). A source that is
+    not a non-empty string is replaced by the document type, so every field
+    is a hashable string by the time observations are deduplicated.
+    """
+    if not isinstance(obj, dict):
+        return None
+    location, issue = obj.get('location'), obj.get('issue')
+    if not isinstance(location, str) or not location.strip() or not isinstance(issue, str) or not issue.strip():
+        return None
+    severity = obj.get('severity')
+    severity = severity.strip().lower() if isinstance(severity, str) else ''
+    severity = SEVERITY_ALIASES.get(severity, severity)
+    details = obj.get('details')
+    if isinstance(details, list):
+        details = '; '.join(item.strip() for item in details if isinstance(item, str) and item.strip())
+    source = obj.get('source')
+    return {
+        "location": location.strip(),
+        "issue": issue.strip(),
+        "severity": severity if severity in SEVERITIES else "unknown",
+        "details": details.strip() if isinstance(details, str) else '',
+        "source": source.strip() if isinstance(source, str) and source.strip() else document_type,
+    }
+
+
+class ObservationStreamParser:
+    """Incremental parser for {"observations": [ {...}, {...} ]} arriving in pieces
+
+    feed() returns the objects of the observations array that were
+    completed by the new text, so each one can be used as soon as its
+    closing brace arrives. Text is scanned once; string contents (including
+    escaped quotes and braces) are tracked so they cannot end an object
+    early. Only the array under the top-level "observations" key is read;
+    other arrays in the response are skipped. Objects that fail to decode
+    are counted in `errors`, and `closed` tells whether the array was
+    terminated (False for a truncated response or one without the key).
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.position = 0
+        self.depth = 0
+        self.array_depth = None
+        self.object_start = None
+        self.in_string = False
+        self.string_start = None
+        self.last_key = None
+        self.escaped = False
+        self.closed = False
+        self.errors = 0
+
+    def feed(self, text):
+        self.buffer += text
+        completed = []
+        buffer = self.buffer
+        for index in range(self.position, len(buffer)):
+            char = buffer[index]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        # The last top-level string before a '[' is that array's key
+                        self.last_key = buffer[self.string_start + 1:index]
+                continue
+            if self.closed:
+                continue
+            if char == '"':
+                self.in_string = True
+                self.string_start = index
+            elif char in '{[':
+                if char == '[' and self.array_depth is None and self.depth == 1 and self.last_key == 'observations':
+                    self.array_depth = self.depth + 1
+                elif char == '{' and self.depth == self.array_depth:
+                    self.object_start = index
+                self.depth += 1
+            elif char in '}]':
+                self.depth -= 1
+                if char == '}' and self.depth == self.array_depth and self.object_start is not None:
+                    try:
+                        completed.append(json.loads(buffer[self.object_start:index + 1]))
+                    except ValueError:
+                        self.errors += 1
+                    self.object_start = None
+                elif char == ']' and self.depth + 1 == self.array_depth:
+                    self.closed = True
+        self.position = len(buffer)
+        return completed
+
+
+def is_complete_extraction(response_text, document_type):
+    """True if a whole JSON-mode response holds a closed observations array of valid objects"""
+    parser = ObservationStreamParser()
+    objects = parser.feed(response_text)
+    return parser.closed and not parser.errors and all(
+        validate_observation(obj, document_type) is not None for obj in objects
+    )
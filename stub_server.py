@@ -0,0 +1,209 @@
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from chunking import is_heading
+
+CANNED_DDR = """# 1. Property Issue Summary
+Stub summary of the main issues found.
+
+# 3. Probable Root Cause
+Stub root cause analysis.
+
+# 5. Recommended Actions
+Stub recommended actions.
+"""
+SOURCE_PATTERN = re.compile(r'"source": "([^"]*)"')
+# "- <location>: <issue>" lines listing what a remainder request should not repeat
+ALREADY_EXTRACTED_PATTERN = re.compile(r'^- (.+?): (.+)$', re.MULTILINE)
+# First lines of the pipeline's extraction prompts: initial, remainder and retry after bad output
+EXTRACTION_PROMPTS = ("Extract all observations", "Some observations from", "A previous extraction of")
+
+
+def canned_extraction(prompt):
+    """Deterministic extraction: one observation per bullet, located under the nearest heading
+
+    For a remainder request, observations the prompt lists as already
+    extracted are left out.
+    """
+    task, _, document = prompt.rpartition("Document:")
+    already = set(ALREADY_EXTRACTED_PATTERN.findall(task))
+    source_match = SOURCE_PATTERN.search(prompt)
+    source = source_match.group(1) if source_match else "unknown"
+    observations = []
+    location = "Unknown"
+    for line in document.splitlines():
+        stripped = line.strip()
+        if is_heading(stripped):
+            location = stripped.rstrip(':')
+        elif stripped.startswith(('-', '*', '•')):
+            issue = stripped.lstrip('-*• ').strip()
+            lowered = issue.lower()
+            severity = "high" if "active" in lowered or "soft" in lowered else "medium"
+            if (location, issue) in already:
+                continue
+            observations.append({
+                "location": location, "issue": issue, "severity": severity,
+                "details": "", "source": source,
+            })
+    return json.dumps({"observations": observations})
+
+
+def canned_response(prompt):
+    """Pick a canned response for a prompt from the DDR pipeline"""
+    if prompt.startswith(EXTRACTION_PROMPTS):
+        return canned_extraction(prompt)
+    return CANNED_DDR
+
+
+class StubLLMServer:
+    """Local OpenAI/Groq-compatible chat completions server that replays canned responses
+
+    Point a client at it with Groq(api_key="stub", base_url=server.url) or
+    GROQ_BASE_URL=<url>. Every request sleeps latency +/- jitter seconds
+    before answering; `responses` is an optional function prompt -> text.
+    Streaming requests are answered as server-sent events.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, responses=None,
+                 chunk_chars=40):
+        self.latency = latency
+        self.jitter = jitter
+        self.responses = responses or canned_response
+        self.chunk_chars = chunk_chars
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _delay(self):
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def do_POST(self):
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                prompt = body.get('messages', [{}])[-1].get('content', '')
+                with stub._lock:
+                    stub.requests += 1
+                stub._delay()
+
+                content = stub.responses(prompt)
+                usage = {
+                    "prompt_tokens": len(prompt) // 4,
+                    "completion_tokens": len(content) // 4,
+                    "total_tokens": (len(prompt) + len(content)) // 4,
+                }
+                if body.get('stream'):
+                    self._send_stream(body.get('model', 'stub'), content, usage)
+                else:
+                    self._send_json({
+                        "id": "chatcmpl-stub",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": body.get('model', 'stub'),
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }],
+                        "usage": usage,
+                    })
+
+            def _send_json(self, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, model, content, usage):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+
+                def event(choices, extra=None):
+                    chunk = {
+                        "id": "chatcmpl-stub", "object": "chat.completion.chunk",
+                        "created": int(time.time()), "model": model, "choices": choices,
+                    }
+                    chunk.update(extra or {})
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+
+                for start in range(0, len(content), stub.chunk_chars):
+                    piece = content[start:start + stub.chunk_chars]
+                    event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+                event([{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                      {"x_groq": {"id": "stub", "usage": usage}})
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stub of the Groq chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds per response")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Random +/- seconds added to latency")
+    args = parser.parse_args()
+
+    server = StubLLMServer(args.host, args.port, args.latency, args.jitter)
+    print(f"Stub LLM server listening on {server.url} (set GROQ_BASE_URL={server.url})")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
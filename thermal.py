@@ -0,0 +1,163 @@
+import re
+import numpy as np
+
+from rule_parser import DIFFERENTIAL_THRESHOLD_F
+
+# Temperature readings: "58°F", "14.4 °C", "60-63°F", "65 deg F"
+TEMPERATURE_PATTERN = re.compile(
+    r'(-?\d+(?:\.\d+)?)(?:\s*-\s*(-?\d+(?:\.\d+)?))?\s*(?:°|deg(?:rees)?\s*)\s*([FC])\b', re.IGNORECASE
+)
+# Cold-zone dimensions: "4 feet x 3 feet", "1.2m x 0.9m"
+DIMENSION_PATTERN = re.compile(
+    r'(\d+(?:\.\d+)?)\s*(feet|foot|ft|m)?\s*[x×]\s*(\d+(?:\.\d+)?)\s*(feet|foot|ft|m)\b', re.IGNORECASE
+)
+# A reading is a reference (not the anomaly) when its segment is labelled like one of these
+REFERENCE_MARKERS = ('surrounding', 'room temp', 'ambient', 'reference', 'baseline', 'normal', 'dry ')
+DELTA_MARKERS = ('differential', 'drop', 'difference', 'delta')
+MEDIUM_DIFFERENTIAL_F = 5.0
+SQ_M_TO_SQ_FT = 10.7639
+
+
+def _to_fahrenheit(value, unit, delta=False):
+    value = float(value)
+    if unit.upper() == 'C':
+        return value * 9 / 5 if delta else value * 9 / 5 + 32
+    return value
+
+
+def _segments(obs):
+    # The fast path joins a finding's bullets with "; ", the LLM tends to use commas or prose
+    return [seg.strip() for seg in f"{obs.get('issue', '')}; {obs.get('details', '')}".split(';') if seg.strip()]
+
+
+def parse_readings(obs):
+    """Pull the temperature readings out of one observation, normalized to °F
+
+    Returns {"spot_f", "reference_f", "delta_f", "area_sqft"} (None when not
+    reported) and the text segments that carried no temperature reading.
+    Only the first reading of a segment counts, so a converted value in
+    brackets ("58°F (14.4°C)") is not read twice; for a range the coldest
+    end is the spot reading.
+    """
+    readings = {"spot_f": None, "reference_f": None, "delta_f": None, "area_sqft": None}
+    prose = []
+    for segment in _segments(obs):
+        dimension = DIMENSION_PATTERN.search(segment)
+        if dimension and readings["area_sqft"] is None:
+            width, _, height, unit = dimension.groups()
+            area = float(width) * float(height)
+            readings["area_sqft"] = area * SQ_M_TO_SQ_FT if unit.lower() == 'm' else area
+        match = TEMPERATURE_PATTERN.search(segment)
+        if not match:
+            prose.append(segment)
+            continue
+        low, high, unit = match.groups()
+        lowered = f" {segment.lower()} "
+        if any(marker in lowered for marker in DELTA_MARKERS):
+            key, value = "delta_f", _to_fahrenheit(low, unit, delta=True)
+        elif any(marker in lowered for marker in REFERENCE_MARKERS):
+            key, value = "reference_f", _to_fahrenheit(high or low, unit)
+        else:
+            key, value = "spot_f", min(_to_fahrenheit(low, unit), _to_fahrenheit(high or low, unit))
+        if readings[key] is None:
+            readings[key] = value
+    return readings, prose
+
+
+def severity_for_differential(differential_f):
+    """Deterministic severity for a temperature differential in °F"""
+    magnitude = abs(differential_f)
+    if magnitude >= DIFFERENTIAL_THRESHOLD_F:
+        return "high"
+    if magnitude >= MEDIUM_DIFFERENTIAL_F:
+        return "medium"
+    return "low"
+
+
+def _column(readings, key):
+    return np.array([np.nan if r[key] is None else r[key] for r in readings], dtype=float)
+
+
+def _number(value):
+    return f"{value:.1f}".rstrip('0').rstrip('.')
+
+
+def _format_f(value):
+    return _number(value) + "°F"
+
+
+def score_observations(observations):
+    """Score every observation with temperature readings and set its severity from the numbers
+
+    Readings are parsed once per observation (kept under obs["readings"], so
+    scoring the same observations again is cheap and gives the same result)
+    and then processed as arrays across the whole batch:
+
+    - differential = reference - spot when both were measured, else the
+      reported differential; a spot reading without a reference of its own is
+      compared with the batch's median reference temperature
+    - anomaly_score = |differential| / high threshold (1.0 = high severity)
+    - zscore = how unusual the differential is within this batch
+
+    Observations that get a differential have their severity replaced by the
+    one the numbers imply; the extracted value is kept as reported_severity
+    when the two disagree. Their details are rewritten to lead with the
+    computed numbers. Observations are updated in place; returns how many
+    were scored.
+    """
+    candidates = []
+    for obs in observations:
+        if "readings" not in obs:
+            readings, prose = parse_readings(obs)
+            if readings["spot_f"] is None and readings["delta_f"] is None:
+                continue
+            obs["readings"] = readings
+            obs["_prose"] = prose
+        candidates.append(obs)
+    if not candidates:
+        return 0
+
+    readings = [obs["readings"] for obs in candidates]
+    spot = _column(readings, "spot_f")
+    reference = _column(readings, "reference_f")
+    delta = _column(readings, "delta_f")
+
+    batch_reference = np.nanmedian(reference) if not np.isnan(reference).all() else np.nan
+    filled_reference = np.where(np.isnan(reference), batch_reference, reference)
+    differential = np.where(np.isnan(spot) | np.isnan(reference), delta, reference - spot)
+    differential = np.where(np.isnan(differential), filled_reference - spot, differential)
+
+    scored = ~np.isnan(differential)
+    anomaly = np.abs(differential) / DIFFERENTIAL_THRESHOLD_F
+    spread = np.nanstd(differential) if scored.sum() > 1 else 0.0
+    zscore = (differential - np.nanmean(differential)) / spread if spread > 0 else np.zeros_like(differential)
+
+    count = 0
+    for index, obs in enumerate(candidates):
+        prose = obs.pop("_prose", None)
+        if not scored[index]:
+            continue
+        value = float(differential[index])
+        obs["readings"].update({
+            "differential_f": round(value, 2),
+            "anomaly_score": round(float(anomaly[index]), 3),
+            "zscore": round(float(zscore[index]), 3),
+        })
+        severity = severity_for_differential(value)
+        previous = str(obs.get("severity") or "").lower()
+        if previous and previous != severity:
+            obs["reported_severity"] = obs["severity"]
+        obs["severity"] = severity
+        obs["severity_source"] = "readings"
+        if prose is not None:
+            numbers = f"ΔT {_format_f(value)}"
+            if not np.isnan(spot[index]) and not np.isnan(filled_reference[index]):
+                label = "reference" if not np.isnan(reference[index]) else "batch reference"
+                numbers += f" ({_format_f(spot[index])} vs {_format_f(filled_reference[index])} {label})"
+            if obs["readings"]["area_sqft"]:
+                numbers += f", {_number(obs['readings']['area_sqft'])} sq ft"
+            numbers += f", anomaly score {obs['readings']['anomaly_score']:.2f}"
+            issue = obs.get('issue', '')
+            obs["details"] = '; '.join([numbers] + [seg for seg in prose if seg != issue.strip()])
+        count += 1
+    return count
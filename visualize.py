@@ -1,33 +1,74 @@
+import io
+import os
 import json
-import matplotlib.pyplot as plt
 from collections import Counter
+from functools import lru_cache
 
-def visualize_severity(merged_data):
-    """Create severity distribution chart"""
+SEVERITY_COLORS = {'high': 'red', 'medium': 'orange', 'low': 'green', 'unknown': 'gray'}
+CHART_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+def chart_dpi():
+    """Raster resolution for charts, from DDR_CHART_DPI (default 150)"""
+    return int(os.getenv('DDR_CHART_DPI', '150'))
+
+def severity_counts(merged_data):
+    """Count merged records per severity, in the order severities first appear"""
     severities = []
     for location, observations in merged_data.items():
         for obs in observations:
             severities.append(obs.get('severity', 'unknown'))
+    return Counter(severities)
+
+def render_severity_chart(counts, fmt="png", dpi=None):
+    """Render the severity distribution chart to image bytes (PNG or SVG)
+    
+    Uses matplotlib's object-oriented Agg API, so there is no pyplot global
+    state and renders can run in parallel threads. Results are cached per
+    (counts, format, dpi), so repeat reports with the same distribution cost
+    nothing. matplotlib is only imported on the first render.
+    """
+    if fmt not in CHART_FORMATS:
+        raise ValueError(f"Unsupported chart format: {fmt}")
+    return _render_cached(tuple(counts.items()), fmt, dpi or chart_dpi())
+
+@lru_cache(maxsize=128)
+def _render_cached(count_items, fmt, dpi):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
     
-    severity_counts = Counter(severities)
+    labels = [str(sev) for sev, _ in count_items]
+    values = [count for _, count in count_items]
+    figure = Figure(figsize=(8, 6))
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+    ax.bar(labels, values, color=[SEVERITY_COLORS.get(label.lower(), 'gray') for label in labels])
+    ax.set_title('Issue Severity Distribution', fontsize=14, fontweight='bold')
+    ax.set_xlabel('Severity Level', fontsize=12)
+    ax.set_ylabel('Count', fontsize=12)
+    ax.grid(axis='y', alpha=0.3)
+    figure.tight_layout()
     
-    plt.figure(figsize=(8, 6))
-    colors = {'high': 'red', 'medium': 'orange', 'low': 'green', 'unknown': 'gray'}
-    bar_colors = [colors.get(sev.lower(), 'gray') for sev in severity_counts.keys()]
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format=fmt, dpi=dpi, bbox_inches='tight')
+    return buffer.getvalue()
+
+def visualize_severity(merged_data, output_dir="output", fmt="png", dpi=None):
+    """Create severity distribution chart
     
-    plt.bar(severity_counts.keys(), severity_counts.values(), color=bar_colors)
-    plt.title('Issue Severity Distribution', fontsize=14, fontweight='bold')
-    plt.xlabel('Severity Level', fontsize=12)
-    plt.ylabel('Count', fontsize=12)
-    plt.grid(axis='y', alpha=0.3)
-    plt.tight_layout()
-    plt.savefig('output/severity_chart.png', dpi=300, bbox_inches='tight')
-    plt.close()
-    print("✅ Severity chart saved to output/severity_chart.png")
-
-def generate_summary_stats(inspection_data, thermal_data):
-    """Generate statistics"""
-    stats = {
+    Returns the image bytes; they are also written to
+    output_dir/severity_chart.<fmt> unless output_dir is None.
+    """
+    chart = render_severity_chart(severity_counts(merged_data), fmt, dpi)
+    if output_dir is not None:
+        chart_path = os.path.join(output_dir, f'severity_chart.{fmt}')
+        with open(chart_path, 'wb') as f:
+            f.write(chart)
+        print(f"✅ Severity chart saved to {chart_path}")
+    return chart
+
+def summary_stats(inspection_data, thermal_data):
+    """Observation counts for the extracted reports (nothing is written or printed)"""
+    return {
         "total_inspection_observations": len(inspection_data.get('observations', [])),
         "total_thermal_observations": len(thermal_data.get('observations', [])),
         "unique_locations": len(set(
@@ -36,11 +77,20 @@ def generate_summary_stats(inspection_data, thermal_data):
         )),
         "sources_processed": 2
     }
+
+def generate_summary_stats(inspection_data, thermal_data, output_dir="output"):
+    """Generate statistics
     
-    with open('output/statistics.json', 'w') as f:
-        json.dump(stats, f, indent=2)
+    The stats are also written to output_dir/statistics.json unless
+    output_dir is None.
+    """
+    stats = summary_stats(inspection_data, thermal_data)
     
-    print(f"✅ Statistics saved to output/statistics.json")
+    if output_dir is not None:
+        stats_path = os.path.join(output_dir, 'statistics.json')
+        with open(stats_path, 'w') as f:
+            json.dump(stats, f, indent=2)
+        print(f"✅ Statistics saved to {stats_path}")
     print(f"   📊 Total observations: {stats['total_inspection_observations'] + stats['total_thermal_observations']}")
     print(f"   📍 Unique locations: {stats['unique_locations']}")
     return stats
\ No newline at end of file